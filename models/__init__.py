@@ -1,8 +1,28 @@
-from . import routeros, dellos10, delln, ios
+import importlib
 
+# Model modules are imported on first use
 MODELS = {
-    "routeros": routeros.RouterOS,
-    "dellos10": dellos10.OS10,
-    "delln": delln.DellN,
-    "ios": ios.IOS,
+    "routeros": ("models.routeros", "RouterOS"),
+    "dellos10": ("models.dellos10", "OS10"),
+    "delln": ("models.delln", "DellN"),
+    "ios": ("models.ios", "IOS"),
 }
+
+
+def get_model_class(name):
+    """
+    Returns model class by model name
+    """
+    module_name, class_name = MODELS[name]
+    model_class = getattr(importlib.import_module(module_name), class_name)
+    globals()[class_name] = model_class
+    return model_class
+
+
+def __getattr__(name):
+    for model_name, (module_name, class_name) in MODELS.items():
+        if module_name == f"{__name__}.{name}":
+            return importlib.import_module(module_name)
+        if class_name == name:
+            return get_model_class(model_name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
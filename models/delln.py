@@ -2,12 +2,13 @@
 DELL N-series (OS6) switch model.
 """
 import logging
+import re
 import time
 from typing import List
 
 from models.model import Model
 from netcommandlib.connection import CommandError, SSHConnection, Actions
-from netcommandlib import parsers, commands
+from netcommandlib import parsers, commands, snmp
 from netcommandlib.image import NetworkImage, GenericImage
 from netcommandlib.version import compare_version
 from netcommandlib import expect
@@ -15,58 +16,95 @@ from netcommandlib import expect
 
 logger = logging.getLogger("Dell N-series")
 
+# sysDescr is for example "Dell Networking N1548P, 6.6.3.10, Linux 4.14.138"
+_SYS_DESCR_MODEL_RE = re.compile(r"^Dell Networking (N\w+),", re.M)
+_SYS_MODEL_RE = re.compile(r"^System Model ID\.+ (.+)$", re.M)
+_CPLD_RE = re.compile(r"^CPLD Version\.+ (.+)$", re.M)
+
 errors = [
     "% Invalid input detected at",
 ]
 
+# Matches whole row containing any of the errors
+_ERROR_RE = re.compile("^.*(?:" + "|".join(re.escape(error) for error in errors) + ").*$", re.M)
+
 
-def find_errors(data):
-    for row in data:
-        for error in errors:
-            if error in row:
-                return row
+def find_errors(data: str):
+    """
+    Returns first row of command output containing an error
+    """
+    match = _ERROR_RE.search(data)
+    if match:
+        return match.group(0).rstrip("\r")
     return None
 
 
 def raise_on_errors(data):
+    if not data:
+        # Nothing to check, for example dry run
+        return
+    if not isinstance(data, str):
+        data = "\n".join(data)
     error = find_errors(data)
     if error:
         raise CommandError(error)
 
 
 class DellN(Model):
+    COMMAND_BLOCKS = True
     VERSION_HEADER = ["unit", "active", "backup", "current-active", "next-active"]
 
     def __init__(self, connection: SSHConnection, hostname: str, enable_password=None):
         self.connection = connection
         self.hostname = hostname
         self.enable_password = enable_password
+        self._elevated = False
+        self._show_version_cache = None
+        self._versions_cache = None
+
+    def _show_version(self, max_age=5.0):
+        """
+        Returns "show version" output, cached for max_age seconds
+        """
+        now = time.monotonic()
+        if self._show_version_cache and now - self._show_version_cache[0] < max_age:
+            return self._show_version_cache[1]
+        stdout = self.execute("show version", timeout=30)
+        self._show_version_cache = (now, stdout)
+        return stdout
 
     def get_platform(self):
-        stdout = self.execute("show version", timeout=30)
-        model_id = parsers.get_regex_data_row(stdout, r"^System Model ID\.+ (.+)$")
+        model_id = parsers.get_regex_data_row(self.snmp_get(snmp.SYS_DESCR) or "", _SYS_DESCR_MODEL_RE)
+        if not model_id:
+            stdout = self._show_version()
+            model_id = parsers.get_regex_data_row(stdout, _SYS_MODEL_RE)
         if model_id.startswith("N"):
             # for example N1548P -> N1500
             return model_id[0:3] + "00"
         return model_id
 
     def _get_software_versions(self):
-        stdout = self.execute("show version", timeout=30)
+        stdout = self._show_version()
+        # Parse each show version output only once
+        if self._versions_cache and self._versions_cache[0] is stdout:
+            return self._versions_cache[1]
         versions = parsers.get_tabular_data(stdout, header=self.VERSION_HEADER)
+        self._versions_cache = (stdout, versions)
         return versions
 
     def _get_software_version(self, image):
-        stdout = self.execute("show version", timeout=30)
-        versions = parsers.get_tabular_data(stdout, header=self.VERSION_HEADER)
-        return versions[0][image]
+        return self._get_software_versions()[0][image]
 
     def get_software_version(self):
+        return self.snmp_get_entity_value(snmp.ENT_PHYSICAL_SOFTWARE_REV) or self._cli_get_software_version()
+
+    def _cli_get_software_version(self):
         versions = self._get_software_versions()
         return versions[0]["active"]
 
     def get_firmware_version(self):
-        stdout = self.execute("show version", timeout=30)
-        return parsers.get_regex_data_row(stdout, r"^CPLD Version\.+ (.+)$")
+        stdout = self._show_version()
+        return parsers.get_regex_data_row(stdout, _CPLD_RE)
 
     def get_supported_image_provider_types(self):
         return ["tftp", "scp"]
@@ -92,7 +130,13 @@ class DellN(Model):
         commands.log_command(self.hostname, command, dry_run=dry_run)
         return self.connection.run_interactive(command, dry_run=dry_run, **kwargs)
 
+    def check_output(self, output):
+        raise_on_errors(output)
+
     def elevate(self):
+        # Already in privileged mode on this session
+        if self._elevated and self.connection.prompt == "#":
+            return
         if self.enable_password:
             password = self.enable_password
         else:
@@ -103,12 +147,13 @@ class DellN(Model):
         self.connection._wait_prompt()
         self.connection.set_prompt("#")
         raise_on_errors(self.execute(f"enable", row_callback=expect.expect_strings(answers)))
+        self._elevated = True
 
     def upgrade(self, image: GenericImage, extra_images: List[GenericImage], dry_run: bool = False):
         if extra_images:
             raise CommandError("Don't know how to handle extra images")
         if not isinstance(image, NetworkImage):
-            raise NotImplemented(f"Image type {type(image)} not implemented")
+            raise NotImplementedError(f"Image type {type(image)} not implemented")
         answers = {
             "Are you sure you want to start?": "y",  # copy
             "Are you sure you want to continue?": "y",  # reload
@@ -132,6 +177,7 @@ class DellN(Model):
                 row_callback=expect.expect_strings(answers),
                 dry_run=dry_run
             )
+            self._show_version_cache = None
             if not dry_run:
                 raise_on_errors(stdout)
                 if not parsers.match_text(stdout, "File transfer operation completed successfully."):
@@ -146,6 +192,7 @@ class DellN(Model):
         version = self._get_software_version("next-active")
         if compare_version(version, image.version) != 0:
             raise_on_errors(self.execute("boot system backup", dry_run=dry_run))
+            self._show_version_cache = None
             version = self._get_software_version("next-active")
         if compare_version(version, image.version) != 0 and not dry_run:
             raise CommandError(f"boot image version {version} didn't match expected {image.version}")
@@ -160,16 +207,29 @@ class DellN(Model):
             ))
         except TimeoutError:
             pass
+        self._show_version_cache = None
 
         if dry_run:
             return True
 
-        # Close connection, wait 60 seconds (for device to reboot) and reconnect.
-        time.sleep(60)
-        self.connection.expect_disconnect()
+        self._wait_device_back()
 
         return True
 
+    def _wait_device_back(self, poll=1, total=180):
+        """
+        Wait until device closes SSH session after reload, then reconnect once it's back.
+        """
+        deadline = time.monotonic() + total
+        while self.connection.is_alive() and time.monotonic() < deadline:
+            time.sleep(poll)
+        if self.connection.is_alive():
+            logger.warning(f"{self.hostname}: Session still open {total} seconds after reload")
+        self.connection.close()
+        # Waits for SSH port to answer again and retries until device accepts connection
+        self.connection.reopen()
+        self._elevated = False
+
     def upgrade_firmware(self, dry_run=False):
         answers = {
             "Are you sure you want to continue?": "y",  # reload
@@ -178,8 +238,10 @@ class DellN(Model):
         # Update bootcode
         self.execute(f"update bootcode", dry_run=dry_run)
         self.execute(f"reload", row_callback=expect.expect_strings(answers), dry_run=dry_run)
+        self._show_version_cache = None
         if not dry_run:
             self.connection.expect_disconnect()
+            self._elevated = False
 
     def get_upgrade_package_name(self, version):
         return f"{self.get_platform()}v{version}.stk"
@@ -6,7 +6,7 @@ import time
 from typing import List
 
 from models.model import Model
-from netcommandlib import parsers, expect, commands
+from netcommandlib import parsers, expect, commands, snmp
 from netcommandlib.connection import Connection, SSHConnection, CommandError
 from netcommandlib.parsers import get_vertical_data_row
 from netcommandlib.image import NetworkImage, GenericImage
@@ -17,18 +17,46 @@ logger = logging.getLogger("Dell OS10")
 class OS10(Model):
 
     PROMPT = "# "
+    COMMAND_BLOCKS = True
 
     def __init__(self, connection: SSHConnection, hostname: str):
         self.connection = connection
         self.hostname = hostname
+        self._show_version_cache = None
 
-    def get_platform(self):
+    def _show_version(self, max_age=5.0):
+        """
+        Returns "show version" output, cached for max_age seconds
+        """
+        now = time.monotonic()
+        if self._show_version_cache and now - self._show_version_cache[0] < max_age:
+            return self._show_version_cache[1]
         stdout = self.execute("show version", timeout=30)
-        # OS type is on first row
-        return stdout.strip().splitlines()[0].split()[-1].strip()
+        self._show_version_cache = (now, stdout)
+        return stdout
+
+    def get_platform(self):
+        stdout = self._show_version()
+        # OS type is last word on first row
+        first_row = stdout.lstrip().partition("\n")[0].split()
+        if not first_row:
+            return None
+        return first_row[-1]
 
     def get_software_version(self):
-        stdout = self.execute("show version", timeout=30)
+        return self.snmp_get_entity_value(snmp.ENT_PHYSICAL_SOFTWARE_REV) or self._cli_get_software_version()
+
+    def _cli_get_software_version(self):
+        stdout = self._show_version()
+        return get_vertical_data_row(stdout, 'Build Version')
+
+    @classmethod
+    def quick_version(cls, connection):
+        if not isinstance(connection, SSHConnection):
+            return None
+        stdout, stderr = connection.run("show version", timeout=30)
+        if stderr:
+            raise CommandError(f"show version failed: {stderr}")
         return get_vertical_data_row(stdout, 'Build Version')
 
     def get_firmware_version(self):
@@ -49,6 +77,25 @@ class OS10(Model):
         commands.log_command(self.hostname, command, dry_run=dry_run)
         return self.connection.run_interactive(command, dry_run=dry_run, **kwargs)
 
+    def _wait_image_state(self, field, terminal, progress, action, timeout, command_timeout=300):
+        """
+        Poll "show image status" until field reaches one of terminal states.
+        Poll interval starts from one second and backs off up to 30 seconds.
+        """
+        deadline = time.monotonic() + timeout
+        delay = 1
+        while True:
+            stdout = self.execute("show image status", timeout=command_timeout)
+            result = parsers.get_vertical_data_row(stdout, field)
+            if result in terminal:
+                return result
+            elif result not in progress:
+                raise CommandError(f"image {action} failed with status: {result}")
+            if time.monotonic() + delay > deadline:
+                raise CommandError(f"image {action} timeout")
+            time.sleep(delay)
+            delay = min(delay * 1.5, 30)
+
     def upgrade(self, image: GenericImage, extra_images: List[GenericImage], dry_run=False):
         # TODO: Check if there's pending update
         command_timeout = 300
@@ -63,52 +110,42 @@ class OS10(Model):
         if extra_images:
             raise CommandError("Don't know how to handle extra images")
         if not isinstance(image, NetworkImage):
-            raise NotImplemented(f"Image type {type(image)} not implemented")
+            raise NotImplementedError(f"Image type {type(image)} not implemented")
         # Upload image
         stdout = self.execute(f"image download {image.get_url()}", timeout=command_timeout)
         if "Download started" not in stdout:
             raise CommandError("image download failed")
-        # show image status
-        i = 0
-        while True:
-            stdout = self.execute("show image status", timeout=command_timeout)
-            result = parsers.get_vertical_data_row(stdout, "File Transfer State")
-            if result == "transfer-success":
-                break
-            elif result == "download":
-                pass
-            else:
-                raise CommandError(f"image download failed with status: {result}")
-            time.sleep(1)
-            i += 1
-            if i > install_timeout:
-                raise CommandError("image download timeout")
+        # Small images may be transferred before command returns, poll only if needed
+        if parsers.get_vertical_data_row(stdout, "File Transfer State") != "transfer-success":
+            # Give device a moment to start the transfer before polling
+            time.sleep(2)
+            self._wait_image_state(
+                "File Transfer State",
+                terminal=["transfer-success"],
+                progress=["download"],
+                action="download",
+                timeout=install_timeout,
+                command_timeout=command_timeout,
+            )
         self.execute(f"image install image://{image.filename}", timeout=command_timeout)
-        i = 0
-        while True:
-            stdout = self.execute("show image status", timeout=command_timeout)
-            result = parsers.get_vertical_data_row(stdout, "Installation State")
-            if result == "idle":
-                break
-            elif result == "install-success":
-                break
-            elif result == "install":
-                pass
-            else:
-                raise CommandError(f"image install failed with status: {result}")
-            time.sleep(1)
-            i += 1
-            if i > install_timeout:
-                raise CommandError("image install timeout")
+        self._wait_image_state(
+            "Installation State",
+            terminal=["idle", "install-success"],
+            progress=["install"],
+            action="install",
+            timeout=install_timeout,
+            command_timeout=command_timeout,
+        )
         # Wait for image installation
         self.execute("boot system standby")
-        raise NotImplemented("Image installation check not implemented")
+        raise NotImplementedError("Image installation check not implemented")
         # Restart device
         try:
             self.execute("reload", row_callback=expect.expect_strings(answers),
                                             timeout=30)
         except TimeoutError:
             pass
+        self._show_version_cache = None
         # Close connection, wait 60 seconds (for device to reboot) and reconnect.
         time.sleep(60)
         self.connection.expect_disconnect()
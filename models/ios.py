@@ -2,38 +2,52 @@
 Cisco IOS switch model.
 """
 import logging
+import re
 import time
 from typing import List, Union
 
 from models.model import Model
 from netcommandlib.connection import CommandError, SSHConnection, TelnetConnection, Actions
-from netcommandlib import parsers, commands
+from netcommandlib import parsers, commands, snmp
 from netcommandlib.image import NetworkImage, GenericImage
 from netcommandlib import expect
 
 
 logger = logging.getLogger("Cisco IOS")
 
+_MODEL_RE = re.compile(r"^Model Number\.+: (.+)$", re.M)
+
 errors = [
     "% Invalid input detected at",
 ]
 
+# Matches whole row containing any of the errors
+_ERROR_RE = re.compile("^.*(?:" + "|".join(re.escape(error) for error in errors) + ").*$", re.M)
+
 
-def find_errors(data):
-    for row in data:
-        for error in errors:
-            if error in row:
-                return row
+def find_errors(data: str):
+    """
+    Returns first row of command output containing an error
+    """
+    match = _ERROR_RE.search(data)
+    if match:
+        return match.group(0).rstrip("\r")
     return None
 
 
 def raise_on_errors(data):
+    if not data:
+        # Nothing to check, for example dry run
+        return
+    if not isinstance(data, str):
+        data = "\n".join(data)
     error = find_errors(data)
     if error:
         raise CommandError(error)
 
 
 class IOS(Model):
+    COMMAND_BLOCKS = True
     VERSION_HEADER = ["Switch", "Ports", "Model", "SW Version", "SW Image", "Mode"]
     VERSION_HEADER_XE = ["Switch", "Ports", "Model", "SW Version", "SW Image"]
 
@@ -41,23 +55,40 @@ class IOS(Model):
         self.connection = connection
         self.hostname = hostname
         self.enable_password = enable_password
-        self.connection.connect()
-        self.connection.run_interactive("terminal length 0")
+        self._elevated = False
+        # Pooled connections are already set up
+        if not self.connection.session_initialized:
+            self.connection.connect()
+            self.connection.run_interactive("terminal length 0")
+            self.connection.session_initialized = True
 
     def get_platform(self):
         stdout = self.execute("show version", timeout=30)
-        model_id = parsers.get_regex_data_row(stdout, r"^Model Number\.+: (.+)$")
+        model_id = parsers.get_regex_data_row(stdout, _MODEL_RE)
         if model_id.startswith("N"):
             # for example N1548P -> N1500
             return model_id[0:3] + "00"
         return model_id
 
     def _get_software_versions(self):
-        stdout = self.execute("show version", timeout=30)
-        versions = parsers.get_tabular_data_fixed_header_width(stdout, header=self.VERSION_HEADER)
+        return self._parse_software_versions(self.execute("show version", timeout=30))
+
+    @classmethod
+    def _parse_software_versions(cls, stdout):
+        versions = parsers.get_tabular_data_fixed_header_width(stdout, header=cls.VERSION_HEADER)
         logger.debug("Versions: %s", (versions,))
         return versions
 
+    @classmethod
+    def quick_version(cls, connection):
+        # Exec channel has no terminal, output isn't paged. Telnet needs interactive setup.
+        if not isinstance(connection, SSHConnection):
+            return None
+        stdout, stderr = connection.run("show version", timeout=30)
+        if stderr:
+            raise CommandError(f"show version failed: {stderr}")
+        return cls._parse_software_versions(stdout)[0]["SW Version"]
+
     @staticmethod
     def login_dialog(username, password):
         def wrapped(row):
@@ -71,6 +102,9 @@ class IOS(Model):
         return wrapped
 
     def get_software_version(self):
+        return self.snmp_get_entity_value(snmp.ENT_PHYSICAL_SOFTWARE_REV) or self._cli_get_software_version()
+
+    def _cli_get_software_version(self):
         versions = self._get_software_versions()
         return versions[0]["SW Version"]
 
@@ -93,7 +127,13 @@ class IOS(Model):
         commands.log_command(self.hostname, command, dry_run=dry_run)
         return self.connection.run_interactive(command, dry_run=dry_run, **kwargs)
 
+    def check_output(self, output):
+        raise_on_errors(output)
+
     def elevate(self):
+        # Already in privileged mode on this session
+        if self._elevated and self.connection.prompt == "#":
+            return
         if self.enable_password:
             password = self.enable_password
         else:
@@ -104,12 +144,13 @@ class IOS(Model):
         self.connection._wait_prompt()
         self.connection.set_prompt("#")
         raise_on_errors(self.connection.run_interactive(f"enable", row_callback=expect.expect_strings(answers)))
+        self._elevated = True
 
     def upgrade(self, image: GenericImage, extra_images: List[GenericImage], dry_run=False):
-        raise NotImplemented("This function is not implemented properly")
+        raise NotImplementedError("This function is not implemented properly")
 
     def upgrade_firmware(self):
-        raise NotImplemented("Not implemented")
+        raise NotImplementedError("Not implemented")
 
     def get_upgrade_package_name(self, version):
-        raise NotImplemented("Not implemented")
+        raise NotImplementedError("Not implemented")
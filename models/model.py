@@ -1,12 +1,24 @@
 import logging
 from abc import abstractmethod, ABCMeta
 
+from netcommandlib import commands as commands_lib
+from netcommandlib import snmp as snmp_lib
+from netcommandlib.connection import can_run_as_block, split_block_output
+
+logger = logging.getLogger("Model")
+
 
 class Model(object):
     __metaclass__ = ABCMeta
 
     PROMPT = ">"
 
+    # Interactive shell models can send read-only commands as one block, see execute_block
+    COMMAND_BLOCKS = False
+
+    # Optional SNMP client for read-only queries
+    snmp = None
+
     def get_username(self, username):
         return username
 
@@ -15,14 +27,22 @@ class Model(object):
         """
         Returns device platform (cpu arch or device model)
         """
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     def get_software_version(self):
         """
         Returns current software version
         """
-        raise NotImplemented
+        raise NotImplementedError
+
+    @classmethod
+    def quick_version(cls, connection):
+        """
+        Returns software version using single exec command without setting up
+        interactive shell or model, None if model doesn't support it
+        """
+        return None
 
     @abstractmethod
     def get_firmware_version(self):
@@ -30,11 +50,38 @@ class Model(object):
         Returns current firmware version
         :return:
         """
-        raise NotImplemented
+        raise NotImplementedError
+
+    def snmp_get(self, oid):
+        """
+        Returns value of oid using SNMP, None if SNMP is not configured or query fails
+        """
+        if not self.snmp:
+            return None
+        try:
+            return self.snmp.get(oid)
+        except snmp_lib.SNMPError as exc:
+            logger.warning(f"{exc}, falling back to CLI")
+        return None
+
+    def snmp_get_entity_value(self, oid):
+        """
+        Returns first non-empty ENTITY-MIB value under oid using SNMP,
+        None if SNMP is not configured or query fails
+        """
+        if not self.snmp:
+            return None
+        try:
+            for value in self.snmp.bulkwalk(oid):
+                if value:
+                    return value
+        except snmp_lib.SNMPError as exc:
+            logger.warning(f"{exc}, falling back to CLI")
+        return None
 
     @staticmethod
     def login_dialog(username, password):
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     def save_config(self, dry_run=False):
@@ -42,7 +89,7 @@ class Model(object):
         Save current configuration to device
         :return:
         """
-        raise NotImplemented
+        raise NotImplementedError
 
     @abstractmethod
     def upgrade(self, image, extra_images, dry_run=False):
@@ -51,28 +98,65 @@ class Model(object):
         :param image:
         :return:
         """
-        raise NotImplemented
+        raise NotImplementedError
+
+    def upload_image(self, image, dry_run=False):
+        """
+        Upload local image to device
+        """
+        raise NotImplementedError(f"Image type {type(image)} not implemented")
+
+    def download_image(self, image, dry_run=False):
+        """
+        Make device download network image
+        """
+        raise NotImplementedError(f"Image type {type(image)} not implemented")
 
     @abstractmethod
     def execute(self, command, dry_run=False, **kwargs):
         """
         Execute command
         """
-        raise NotImplemented
+        raise NotImplementedError
+
+    def check_output(self, output):
+        """
+        Raise CommandError if command output contains an error, nothing is checked by default
+        """
+        pass
 
     def execute_block(self, commands, dry_run=False, **kwargs):
-        out = []
+        """
+        Execute commands and return output of each of them.
+        With COMMAND_BLOCKS read-only commands are sent in one go and output is split per command,
+        other commands are run one by one so next command isn't taken as answer to a question.
+        """
+        if not self.COMMAND_BLOCKS:
+            out = []
+            for command in commands:
+                out.append(self.execute(command, dry_run=dry_run, **kwargs))
+            return out
+        commands = [x.strip() for x in commands if x.strip()]
         for command in commands:
-            out.append(self.execute(command, dry_run=dry_run, **kwargs))
-        return out
+            commands_lib.log_command(self.hostname, command, dry_run=dry_run)
+        if not commands or dry_run:
+            return []
+        if kwargs.get("row_callback") or not can_run_as_block(commands):
+            outputs = [self.connection.run_interactive(command, **kwargs) for command in commands]
+        else:
+            stdout = self.connection.run_interactive_block(commands, **kwargs)
+            outputs = split_block_output(stdout, self.connection.prompt, commands)
+        for output in outputs:
+            self.check_output(output)
+        return outputs
 
     @abstractmethod
     def get_upgrade_package_name(self, version):
-        raise NotImplemented
+        raise NotImplementedError
 
     def get_extra_package_names(self, version):
         return []
 
     @abstractmethod
     def get_supported_image_provider_types(self):
-        raise NotImplemented
+        raise NotImplementedError
@@ -2,6 +2,7 @@
 RouterOS model.
 """
 import logging
+import re
 import time
 from typing import List
 
@@ -38,8 +39,49 @@ cli_duplicate_warnings = [
 cli_warnings = []
 
 
+_CLI_MARKERS = {
+    "mismatch": ['input does not match '],
+    "error": cli_errors,
+    "warning": cli_warnings,
+    "duplicate": cli_duplicate_warnings,
+    "reboot": ['please reboot'],
+}
+
+
+def _compile_markers(markers):
+    """
+    Compile all marker strings into single regex with one group per string.
+    Longer strings are tried first and each group maps to every marker kind
+    contained in it, so overlapping markers like 'failure: ' are all reported.
+    """
+    strings = sorted({x for patterns in markers.values() for x in patterns}, key=len, reverse=True)
+    kinds = {
+        f"m{i}": frozenset(name for name, patterns in markers.items() if any(x in string for x in patterns))
+        for i, string in enumerate(strings)
+    }
+    regex = re.compile("|".join(f"(?P<m{i}>{re.escape(x)})" for i, x in enumerate(strings)))
+    return regex, kinds
+
+
+_CLI_MARKER_RE, _CLI_MARKER_KINDS = _compile_markers(_CLI_MARKERS)
+
+
+def find_markers(stdout):
+    """
+    Returns set of marker kinds found from command output with single scan
+    """
+    return set().union(*(_CLI_MARKER_KINDS[match.lastgroup] for match in _CLI_MARKER_RE.finditer(stdout)))
+
+
+# RouterOS fails with "max line length 65535 exceeded!", leave some headroom
+MAX_BLOCK_LENGTH = 60000
+
+# Printed between command outputs in batched commands
+BATCH_SEPARATOR = "---NETCOMMAND-BATCH---"
+
+
 class RouterOS(Model):
-    extra_packages = [
+    EXTRA_PACKAGES = frozenset([
         "calea",
         "container",
         "dude",
@@ -55,35 +97,67 @@ class RouterOS(Model):
         "wireless",
         "wifi-qcom",
         "wifi-qcom-ac",
+    ])
+
+    PACKAGE_HEADERS = [
+        ["#", "NAME", "VERSION", "BUILD-TIME", "SIZE"],
+        # RouterOS 7.0-7.12
+        ["#", "NAME", "VERSION"],
+        # RouterOS 6
+        ["#", "NAME", "VERSION", "SCHEDULED"],
     ]
 
     def __init__(self, connection: Connection, hostname: str):
         self.connection = connection
         self.hostname = hostname
+        # Device information which doesn't change without reboot
+        self._cache = {}
+        # Local images waiting to be uploaded, see upload_image
+        self._uploads = []
 
     def get_username(self, username):
         return f"{username}+ct511w4098h"
 
+    def _cache_resource(self, stdout):
+        self._cache["platform"] = get_vertical_data_row(stdout, 'architecture-name')
+        self._cache["software_version"] = get_vertical_data_row(stdout, 'version').split(None, 1)[0].strip()
+
     def get_platform(self):
-        stdout = self.execute("/system resource print")
-        return get_vertical_data_row(stdout, 'architecture-name')
+        if "platform" not in self._cache:
+            self._cache_resource(self.execute("/system resource print"))
+        return self._cache["platform"]
 
     def get_software_version(self):
-        stdout = self.execute("/system resource print")
-        return get_vertical_data_row(stdout, 'version').split(None, 1)[0].strip()
+        if "software_version" not in self._cache:
+            self._cache_resource(self.execute("/system resource print"))
+        return self._cache["software_version"]
+
+    def _routerboard_print(self, force=False):
+        """
+        Returns /system routerboard print output as dict, cached until force is set.
+        Raises CommandError on non routerboard devices.
+        """
+        if force or "routerboard" not in self._cache:
+            try:
+                stdout = self.execute("/system routerboard print")
+            except CommandError:
+                self._cache["routerboard"] = None
+                raise
+            self._cache["routerboard"] = parsers.get_vertical_data_rows(stdout)
+        if self._cache["routerboard"] is None:
+            raise CommandError(f"{self.hostname}: Not a routerboard device")
+        return self._cache["routerboard"]
 
     def get_firmware_version(self):
         try:
-            stdout = self.execute("/system routerboard print")
-            return get_vertical_data_row(stdout, 'current-firmware')
+            return self._routerboard_print().get('current-firmware')
         except CommandError:
             # Non routerboard device
             return self.get_software_version()
 
     def get_firmware_type(self):
         try:
-            stdout = self.execute("/system routerboard print")
-            return get_vertical_data_row(stdout, 'firmware-type')
+            return self._routerboard_print().get('firmware-type')
         except CommandError:
             return None
 
@@ -103,42 +177,80 @@ class RouterOS(Model):
             return "DRY RUN"
         (stdout, stderr) = self.connection.run(command)
 
+        if not ignore_errors and stderr:
+            raise CommandError("SSH returned error: %s" % (stderr,))
+        markers = find_markers(stdout)
+        if "mismatch" in markers:
+            raise CommandError("SSH returned error %s" % (stdout,))
         if not ignore_errors:
-            if stderr:
-                raise CommandError("SSH returned error: %s" % (stderr,))
-            for exception in cli_errors:
-                if exception in stdout:
-                    raise CommandError("SSH returned error: %s" % (stdout,))
+            if "error" in markers:
+                raise CommandError("SSH returned error: %s" % (stdout,))
             if not ignore_warnings or not ignore_duplicate:
-                for warning in cli_warnings:
-                    if warning in stdout:
-                        raise CommandError("SSH returned warning: %s" % (stdout,))
+                if "warning" in markers:
+                    raise CommandError("SSH returned warning: %s" % (stdout,))
             if not ignore_duplicate:
-                for warning in cli_duplicate_warnings:
-                    if warning in stdout:
-                        raise CommandError("SSH returned duplication warning: %s" % (stdout,))
-        if 'input does not match ' in stdout:
-            raise CommandError("SSH returned error %s" % (stdout,))
-        logger.debug("%s: SSH:\n%s", self.hostname, stdout)
+                if "duplicate" in markers:
+                    raise CommandError("SSH returned duplication warning: %s" % (stdout,))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s: SSH:\n%s", self.hostname, stdout)
         return stdout
 
+    def command_batch(self, command_list, **kwargs):
+        """
+        Run multiple commands in one round-trip and return output of each command.
+        Commands must exist on device, unknown commands fail whole batch.
+        """
+        script = "".join(f':put "{BATCH_SEPARATOR}"; {command}; ' for command in command_list)
+        stdout = self.command("{ " + script + "}", **kwargs)
+        outputs = stdout.split(BATCH_SEPARATOR)[1:]
+        if len(outputs) != len(command_list):
+            raise CommandError(f"Expected {len(command_list)} outputs from batch, got {len(outputs)}")
+        return outputs
+
     def execute_block(self, commands, dry_run=False, **kwargs):
-        out = ""
-        buffer = ""
+        # Each menu path gets its own { } section
+        sections = []
+        buffer = []
         for command in commands:
             command = command.strip()
             if not command or command.startswith("#"):
                 continue
             if command.startswith("/") and buffer:
-                # execute buffer
-                out += (self.execute("{ " + buffer + ' }', dry_run=dry_run))
-                buffer = ""
-            buffer += command + "; "
+                sections.append("{ " + "; ".join(buffer) + '; }')
+                buffer = []
+            buffer.append(command)
         if buffer:
-            out += (self.execute("{ " + buffer + ' }', dry_run=dry_run))
-        return out
+            sections.append("{ " + "; ".join(buffer) + '; }')
+
+        # Send as many sections at once as fits on a command line
+        out = []
+        batch = []
+        batch_length = 0
+        for section in sections:
+            if batch and batch_length + len(section) + 2 > MAX_BLOCK_LENGTH:
+                out.append(self.execute("; ".join(batch), dry_run=dry_run))
+                batch = []
+                batch_length = 0
+            batch.append(section)
+            batch_length += len(section) + 2
+        if batch:
+            out.append(self.execute("; ".join(batch), dry_run=dry_run))
+        return "".join(out)
+
+    def upload_image(self, image: LocalImage, dry_run=False):
+        """
+        Queue local image for upload, queued images are uploaded together by _flush_uploads
+        """
+        logger.info(f"{self.hostname}: Uploading new image file '{image.filename}' to {self.connection.get_address()}")
+        self._uploads.append((image.path, image.filename))
+
+    def _flush_uploads(self, dry_run=False):
+        uploads, self._uploads = self._uploads, []
+        if uploads and not dry_run:
+            self.connection.upload_files(uploads)
 
-    def download_image(self, image: HTTPImage, dry_run):
+    def download_image(self, image: HTTPImage, dry_run=False):
+        logger.info(f"{self.hostname}: Downloading new image file '{image.get_url()}' to {self.connection.get_address()}")
         return self.execute(f"/tool fetch url=\"{image.get_url()}\" output=file", dry_run=dry_run)
 
     def get_extra_packages(self, version):
@@ -146,31 +258,37 @@ class RouterOS(Model):
         TODO: Wifiwave2 package has been replaced in 7.13 with wifi-qcom and wifi-qcom-ac packages.
         TODO: Devices with wlan interface need wireless package starting from version 7.13
         """
+        # Interfaces are needed only when crossing 7.13, fetch them in the same batch when that is likely
+        fetch_resource = "software_version" not in self._cache
+        if fetch_resource:
+            fetch_interfaces = compare_version(version, "7.13") >= 0
+        else:
+            fetch_interfaces = (
+                compare_version(self.get_software_version(), "7.13") < 0 and compare_version(version, "7.13") >= 0
+            )
+        command_list = ["/system package print"]
+        if fetch_resource:
+            command_list.insert(0, "/system resource print")
+        if fetch_interfaces:
+            command_list.append("/interface print detail")
+        if len(command_list) > 1:
+            outputs = self.command_batch(command_list)
+        else:
+            outputs = [self.command(command_list[0])]
+        if fetch_resource:
+            self._cache_resource(outputs.pop(0))
+        # Split once, rows are parsed twice
+        data = outputs[0].splitlines()
+        interface_raw_data = outputs[1] if fetch_interfaces else None
         current_version = self.get_software_version()
         firmware_type = self.get_firmware_type()
-        data = self.command("/system package print")
-        packages = parsers.get_tabular_data(
-            data,
-            header=["#", "NAME", "VERSION", "BUILD-TIME", "SIZE"],
-            skip_after_header=0
-        )
-        if not packages:
-            # Maybe routeros 7.0-7.12
-            packages = parsers.get_tabular_data(
-                data,
-                header=["#", "NAME", "VERSION"],
-                skip_after_header=0
-            )
-        if not packages:
-            # Maybe routeros 6
-            packages = parsers.get_tabular_data(
-                data,
-                header=["#", "NAME", "VERSION", "SCHEDULED"],
-                skip_after_header=0
-            )
+        header = parsers.find_header(data, self.PACKAGE_HEADERS)
+        packages = []
+        if header:
+            packages = parsers.get_tabular_data(data, header=header, skip_after_header=0)
         if not packages:
             raise RuntimeError("Failed to get installed packages")
-        extra_packages = [x for x in packages if x["NAME"] in self.extra_packages]
+        extra_packages = [x for x in packages if x["NAME"] in self.EXTRA_PACKAGES]
         if firmware_type:
             if compare_version(current_version, "7.13") < 0 and compare_version(version, "7.13") >= 0:
                 idx = 0
@@ -185,51 +303,31 @@ class RouterOS(Model):
                             logger.warning(
                                 f"{self.hostname}: Don't know replacement for wifiwave2 package for {firmware_type}"
                             )
-                            raise NotImplemented(f"Don't know replacement for wifiwave2 package for {firmware_type}")
+                            raise NotImplementedError(f"Don't know replacement for wifiwave2 package for {firmware_type}")
                         break
                     idx += 1
                 else:
                     # We need a wireless package if we have wlan interfaces
-                    interface_raw_data = self.command("/interface print detail")
+                    if interface_raw_data is None:
+                        interface_raw_data = self.command("/interface print detail")
                     if 'type="wlan"' in interface_raw_data:
                         extra_packages.append({"NAME": "wireless", "VERSION": current_version})
         return extra_packages
 
     def upgrade(self, image: GenericImage, extra_images: List[GenericImage], dry_run=False):
         # TODO: Check for extra packages!
-        # Upload image
-        if not isinstance(image, LocalImage) and not isinstance(image, HTTPImage):
-            raise NotImplemented(f"Image type {type(image)} not implemented")
-
-        for extra_image in extra_images:
-            if isinstance(extra_image, LocalImage):
-                logger.info(
-                    f"{self.hostname}: Uploading new image file '{extra_image.filename}' to {self.connection.get_address()}"
-                )
-                if not dry_run:
-                    with open(extra_image.path, 'rb') as f:
-                        self.connection.upload_file(f, extra_image.filename)
-            elif isinstance(extra_image, HTTPImage):
-                self.download_image(image=extra_image, dry_run=dry_run)
-            else:
-                raise NotImplemented(f"Image type {type(extra_image)} not implemented")
-
         current_version = self.get_software_version()
 
         if compare_version(current_version, "7.12.0") < 0 and compare_version(image.version, "7.13.0") >= 0:
             # We need to update first to version 7.12.1 or 7.12.0 and continue then to >= 7.13.
             raise RuntimeError("Please update first to version 12.1 and after that to later versions")
 
-        if isinstance(image, LocalImage):
-            logger.info(f"{self.hostname}: Uploading new image file '{image.filename}' to {self.connection.get_address()}")
-            if not dry_run:
-                with open(image.path, 'rb') as f:
-                    self.connection.upload_file(f, image.filename)
-        elif isinstance(image, HTTPImage):
-            logger.info(
-                f"{self.hostname}: Downloading new image file '{image.get_url()}' to {self.connection.get_address()}"
-            )
-            self.download_image(image=image, dry_run=dry_run)
+        # Downloads start right away, local images are uploaded together afterwards
+        self._uploads = []
+        for extra_image in extra_images:
+            extra_image.transfer_to(self, dry_run=dry_run)
+        image.transfer_to(self, dry_run=dry_run)
+        self._flush_uploads(dry_run=dry_run)
 
         # Restart device
         logger.info(f"{self.hostname}: Rebooting {self.connection.get_address()}")
@@ -244,27 +342,32 @@ class RouterOS(Model):
         if not dry_run:
             # Close connection, wait 5 seconds (for device to reboot) and reconnect.
             self.connection.expect_disconnect()
+            self._cache.pop("software_version", None)
+            self._cache.pop("routerboard", None)
         # Upgrade firmware
         return self.upgrade_firmware(dry_run=dry_run)
 
     def upgrade_firmware(self, dry_run=False):
         try:
-            stdout = self.execute("/system routerboard print")
-            current_firmware = get_vertical_data_row(stdout, 'current-firmware')
-            upgrade_firmware = get_vertical_data_row(stdout, 'upgrade-firmware')
+            routerboard = self._routerboard_print()
+            current_firmware = routerboard.get('current-firmware')
+            upgrade_firmware = routerboard.get('upgrade-firmware')
         except CommandError:
             logger.exception(f"{self.hostname}: Failed to check firmware version")
             return True
 
         if current_firmware != upgrade_firmware:
             logger.info(f"{self.hostname}: Upgrading routerboard firmware on {self.connection.get_address()}")
-            self.execute("/system routerboard upgrade", dry_run=dry_run)
+            stdout = self.execute("/system routerboard upgrade", dry_run=dry_run)
             # Wait for "Firmware upgraded successfully, please reboot for changes to take effect!" text
-            if not dry_run:
+            if not dry_run and "reboot" not in find_markers(stdout):
+                # Poll after 1, 2, 4, 8 and 8 seconds
+                delay = 1
                 for i in range(5):
-                    time.sleep(5)
+                    time.sleep(delay)
+                    delay = min(delay * 2, 8)
                     stdout = self.command("/system routerboard print")
-                    if 'please reboot' in stdout:
+                    if "reboot" in find_markers(stdout):
                         break
                 else:
                     raise RuntimeError("Timeout while waiting firmware upgrade")
@@ -281,9 +384,9 @@ class RouterOS(Model):
             self.connection.expect_disconnect()
 
             # Check current-firmware is same as upgrade-firmware after upgrade
-            stdout = self.command("/system routerboard print")
-            current_firmware = get_vertical_data_row(stdout, 'current-firmware')
-            upgrade_firmware = get_vertical_data_row(stdout, 'upgrade-firmware')
+            routerboard = self._routerboard_print(force=True)
+            current_firmware = routerboard.get('current-firmware')
+            upgrade_firmware = routerboard.get('upgrade-firmware')
 
         if dry_run:
             return True
@@ -300,7 +403,5 @@ class RouterOS(Model):
         :param version: New version
         :return: list of extra packages
         """
-        data = []
-        for package in self.get_extra_packages(version):
-            data.append(f"{package['NAME']}-{version}-{self.get_platform()}.npk")
-        return data
+        platform = self.get_platform()
+        return [f"{package['NAME']}-{version}-{platform}.npk" for package in self.get_extra_packages(version)]
@@ -5,24 +5,37 @@ NetCommand
 CLI device batch command tool.
 """
 
+import atexit
 import getpass
 import logging
 import os.path
+import queue
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from logging.handlers import QueueHandler, QueueListener
 from typing import Dict, Union
 
 import yaml
 import argparse
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 import models
 from models.model import Model
 from netcommandlib import commands
 from netcommandlib.connection import SSHConnection, connection_from_opts
-from netcommandlib.image_provider import IMAGE_PROVIDERS
+from netcommandlib.image_provider import IMAGE_PROVIDERS, find_images_any
 from netcommandlib.inventory import Inventory
+from netcommandlib.pool import CONNECTION_POOL
+from netcommandlib.snmp import snmp_from_opts
 from netcommandlib.upgrade import generic_upgrade
 
 logger = logging.getLogger("batch_update")
 
+DEFAULT_PARALLEL = 16
+
 
 def get_model(hostname: str, opts: Dict) -> Union[Model, None]:
     model_name = opts.get("model", "unknown")
@@ -30,17 +43,54 @@ def get_model(hostname: str, opts: Dict) -> Union[Model, None]:
         logger.error(f"Host {hostname} model {model_name} is not supported")
         return None
 
-    if "prompt" not in opts:
-        opts["prompt"] = models.MODELS[model_name].PROMPT
-
-    connection = connection_from_opts(opts, login_dialog=models.MODELS[model_name].login_dialog)
+    model_class = models.get_model_class(model_name)
+    connection = get_connection(opts, model_class)
 
-    model = models.MODELS[model_name](connection=connection, hostname=hostname)
+    try:
+        model = model_class(connection=connection, hostname=hostname)
+        model.snmp = snmp_from_opts(opts)
+    except BaseException:
+        release_connection(opts, connection, failed=True)
+        raise
 
     # connection.connect()
     return model
 
 
+def get_connection(opts: Dict, model_class):
+    """
+    Returns pooled connection for host, or opens new one
+    """
+    if "prompt" not in opts:
+        opts["prompt"] = model_class.PROMPT
+
+    return CONNECTION_POOL.get(
+        connection_key(opts),
+        factory=lambda: connection_from_opts(opts, login_dialog=model_class.login_dialog)
+    )
+
+
+def connection_key(opts: Dict):
+    return opts["hostname"], opts.get("port"), opts.get("username"), opts.get("model", "unknown")
+
+
+def release_connection(opts: Dict, connection, failed=False):
+    """
+    Return connection to connection pool for reuse. Connection of failed run may be broken, it is closed instead.
+    """
+    if failed:
+        CONNECTION_POOL.discard(connection_key(opts), connection)
+    else:
+        CONNECTION_POOL.release(connection_key(opts), connection)
+
+
+def release_model(opts: Dict, model: Model, failed=False):
+    """
+    Return model's connection to connection pool for reuse
+    """
+    release_connection(opts, model.connection, failed=failed)
+
+
 def update(args, hostname, opts, image_providers, dry_run=False):
     result = {
         "status": "FAILED"
@@ -50,62 +100,66 @@ def update(args, hostname, opts, image_providers, dry_run=False):
 
     model = get_model(hostname, opts)
     if not model:
-        return False
+        return result
 
-    current_software_version = model.get_software_version()
-    current_firmware_version = model.get_firmware_version()
+    failed = False
+    try:
+        current_software_version = model.get_software_version()
+        current_firmware_version = model.get_firmware_version()
 
-    platform = model.get_platform()
+        platform = model.get_platform()
 
-    result.update({
-        "initial_software_version": current_software_version,
-        "current_software_version": current_software_version,
-        "initial_firmware_version": current_firmware_version,
-        "current_firmware_version": current_firmware_version,
-    })
+        result.update({
+            "initial_software_version": current_software_version,
+            "current_software_version": current_software_version,
+            "initial_firmware_version": current_firmware_version,
+            "current_firmware_version": current_firmware_version,
+        })
 
-    filename = model.get_upgrade_package_name(args.version)
-    image = None
-    for image_provider in image_providers:
-        if image_provider.type not in model.get_supported_image_provider_types():
-            continue
-        image = image_provider.find_image(filename, version=args.version, platform=platform)
-        if image:
-            break
-
-    if not image:
-        logger.error(
-            f"{hostname}: Failed to find upgrade image '{filename}' for {args.version} {model.get_platform()}")
-        return result
+        supported_types = model.get_supported_image_provider_types()
+        model_image_providers = [x for x in image_providers if x.type in supported_types]
 
-    extra_images = []
-    for extra_image_filename in model.get_extra_package_names(args.version):
-        extra_image = None
-        for image_provider in image_providers:
-            if image_provider.type not in model.get_supported_image_provider_types():
-                continue
-            extra_image = image_provider.find_image(extra_image_filename, version=args.version, platform=platform)
-            if extra_image:
-                break
-
-        if not extra_image:
+        filename = model.get_upgrade_package_name(args.version)
+        extra_image_filenames = model.get_extra_package_names(args.version)
+
+        # Look up all images from all providers at once, first provider having an image wins
+        images = find_images_any(
+            model_image_providers, [filename] + extra_image_filenames, version=args.version, platform=platform
+        )
+
+        image = images.get(filename)
+        if not image:
             logger.error(
-                f"{hostname}: Failed to find extra image '{extra_image_filename}' for {args.version} {model.get_platform()}")
+                f"{hostname}: Failed to find upgrade image '{filename}' for {args.version} {platform}")
             return result
-        extra_images.append(extra_image)
 
-    try:
-        if not dry_run:
-            model.save_config()
-        if generic_upgrade(hostname, model, image, extra_images, dry_run=dry_run):
-            result["status"] = "SUCCESS"
-        if not dry_run:
-            result["current_software_version"] = model.get_software_version()
-            result["current_firmware_version"] = model.get_firmware_version()
-        else:
-            result["current_software_version"] = image.version
-    except Exception as exc:
-        logger.exception(f"{hostname}: Upgrade failed: {exc}")
+        extra_images = []
+        for extra_image_filename in extra_image_filenames:
+            extra_image = images.get(extra_image_filename)
+            if not extra_image:
+                logger.error(
+                    f"{hostname}: Failed to find extra image '{extra_image_filename}' for {args.version} {platform}")
+                return result
+            extra_images.append(extra_image)
+
+        try:
+            if not dry_run:
+                model.save_config()
+            if generic_upgrade(hostname, model, image, extra_images, dry_run=dry_run):
+                result["status"] = "SUCCESS"
+            if not dry_run:
+                result["current_software_version"] = model.get_software_version()
+                result["current_firmware_version"] = model.get_firmware_version()
+            else:
+                result["current_software_version"] = image.version
+        except Exception as exc:
+            failed = True
+            logger.exception(f"{hostname}: Upgrade failed: {exc}")
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        release_model(opts, model, failed=failed)
     return result
 
 
@@ -113,8 +167,35 @@ def version(args, hostname, opts, image_providers, dry_run=False):
     result = {
         "status": "FAILED"
     }
+    model_name = opts.get("model", "unknown")
+    # Without SNMP try reading version with single command before setting up the model
+    if model_name in models.MODELS and "snmp_community" not in opts:
+        model_class = models.get_model_class(model_name)
+        connection = get_connection(opts, model_class)
+        failed = True
+        try:
+            result["version"] = model_class.quick_version(connection)
+            failed = False
+        except Exception as exc:
+            # For example exec channels not allowed or unexpected output, interactive model may still work
+            logger.debug(f"{hostname}: Quick version lookup failed, falling back to model: {exc}")
+            result["version"] = None
+        finally:
+            release_connection(opts, connection, failed=failed)
+        if result["version"] is not None:
+            result["status"] = "SUCCESS"
+            return result
     model = get_model(hostname, opts)
-    result["version"] = model.get_software_version()
+    if not model:
+        return result
+    failed = False
+    try:
+        result["version"] = model.get_software_version()
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        release_model(opts, model, failed=failed)
     result["status"] = "SUCCESS"
     return result
 
@@ -127,18 +208,43 @@ def command(args, hostname, opts, image_providers, dry_run=False):
         commands = f.read().splitlines()
 
     model = get_model(hostname, opts)
+    if not model:
+        return result
 
     logger.info(f"Executing commands: {commands}")
 
-    if not dry_run:
-        logger.info('\n'.join(model.execute_block(commands)))
-    else:
-        logger.info("DRY RUN")
+    failed = False
+    try:
+        if not dry_run:
+            logger.info('\n'.join(model.execute_block(commands)))
+        else:
+            logger.info("DRY RUN")
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        release_model(opts, model, failed=failed)
 
     result["status"] = "SUCCESS"
     return result
 
 
+def setup_logging(level):
+    """
+    Log through a queue so that writing log output doesn't block command execution
+    """
+    log_format = '%(asctime)s: %(levelname)-8s: %(message)s'
+    log_date_format = '%Y-%m-%d %H:%M:%S'
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(log_format, datefmt=log_date_format))
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler)
+    logging.basicConfig(level=level, handlers=[QueueHandler(log_queue)])
+    listener.start()
+    atexit.register(listener.stop)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-d", "--debug", action="store_true", default=False)
@@ -146,6 +252,8 @@ def main():
     parser.add_argument("-P", "--prompt-password", help="Prompt password", default=False, action="store_true")
     parser.add_argument("-S", "--stop-on-error", help="stop on first error", default=False, action="store_true")
     parser.add_argument("-l", "--limit", help="Limit to hosts/groups", default="")
+    parser.add_argument("-j", "--parallel", help=f"Number of hosts processed in parallel, default {DEFAULT_PARALLEL}",
+                        type=int, default=DEFAULT_PARALLEL)
     parser.add_argument("-C", "--check", help="Check mode, don't make changes", default=False, action="store_true")
     parser.add_argument("--debug-commands", help="Debug commands", default=False, action="store_true")
     parser.add_argument("inventory", help="Inventory file")
@@ -163,14 +271,11 @@ def main():
 
     args = parser.parse_args()
 
-    log_format = '%(asctime)s: %(levelname)-8s: %(message)s'
-    log_date_format = '%Y-%m-%d %H:%M:%S'
-
     if args.debug:
-        logging.basicConfig(level=logging.DEBUG, format=log_format, datefmt=log_date_format)
+        setup_logging(logging.DEBUG)
         logging.getLogger(None).setLevel(logging.DEBUG)
     else:
-        logging.basicConfig(level=logging.INFO, format=log_format, datefmt=log_date_format)
+        setup_logging(logging.INFO)
 
     if args.debug_commands:
         commands.logger.setLevel(logging.DEBUG)
@@ -181,7 +286,7 @@ def main():
         limits = []
 
     with open(args.inventory, 'r') as f:
-        inventory_data = yaml.load(f.read(), Loader=yaml.SafeLoader)
+        inventory_data = yaml.load(f.read(), Loader=SafeLoader)
         if "opts" not in inventory_data:
             inventory_data["opts"] = {}
         if args.prompt_key_password:
@@ -200,7 +305,9 @@ def main():
         hosts = inventory.hosts
 
     image_providers = []
-    for source_name, source_opts in inventory.sources.items():
+    # Only updates need image sources
+    sources = inventory.sources if args.func == update else {}
+    for source_name, source_opts in sources.items():
         source_type = source_opts.get("type", "local")
         if source_type not in IMAGE_PROVIDERS:
             raise RuntimeError(f"Invalid image source type {source_type} on source {source_name}")
@@ -215,22 +322,31 @@ def main():
         results[hostname] = {
             "status": "SKIPPED",
         }
-    for hostname, opts in hosts.items():
-        try:
-            results[hostname] = args.func(args, hostname, opts, image_providers=image_providers,
-                                          dry_run=args.check)
-            if results[hostname]["status"] == "SUCCESS":
-                success += 1
-            else:
+    with ThreadPoolExecutor(max_workers=max(1, args.parallel)) as executor:
+        futures = {
+            executor.submit(args.func, args, hostname, opts, image_providers=image_providers, dry_run=args.check): hostname
+            for hostname, opts in hosts.items()
+        }
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                hostname = futures[future]
+                try:
+                    results[hostname] = future.result()
+                    if results[hostname]["status"] == "SUCCESS":
+                        success += 1
+                        continue
+                except Exception as exc:
+                    results[hostname] = {"status": "FAILED"}
+                    logger.exception(f"Failed host {hostname}: {exc}")
                 failed += 1
-                if args.stop_on_error:
-                    break
-        except Exception as exc:
-            results[hostname] = {"status": "FAILED"}
-            logger.exception(f"Failed host {hostname}: {exc}")
-            failed += 1
-            if args.stop_on_error:
-                break
+            if failed and args.stop_on_error:
+                # Let already running hosts finish, hosts not started are left skipped
+                pending = {future for future in pending if not future.cancel()}
+
+    for image_provider in image_providers:
+        image_provider.close()
 
     details = ""
     if args.check:
@@ -263,6 +379,8 @@ def main():
     else:
         print(f"All done, success: {success}, failed: {failed}")
 
+    CONNECTION_POOL.close_all()
+
 
 if __name__ == '__main__':
     main()
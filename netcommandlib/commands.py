@@ -1,9 +1,14 @@
 import logging
+import os
 
 logger = logging.getLogger("commands")
 
+# LOG_COMMANDS=0 disables command logging completely, for example in benchmarks
+LOG_COMMANDS = os.environ.get("LOG_COMMANDS", "1") != "0"
+
 
 def log_command(host, command, dry_run=False):
+    if not LOG_COMMANDS or not logger.isEnabledFor(logging.DEBUG):
+        return
     dry_run_string = " (DRY RUN)" if dry_run else ""
     logger.debug("%s: Executing command%s: %s", host, dry_run_string, command)
-
@@ -1,6 +1,11 @@
+import asyncio
+import errno
 import os
+import select
 import socket
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from enum import Enum
 
 import paramiko
@@ -10,6 +15,23 @@ import logging
 logger = logging.getLogger("Connection")
 logging.getLogger("paramiko.transport").setLevel(logging.ERROR)
 
+SSH_KEEPALIVE_INTERVAL = 30
+
+# Maximum bytes read per receive call. Large reads drain buffered output with fewer calls and chunks.
+RECEIVE_SIZE = 65536
+
+# Delay before returning empty result from closed connection, prevents busy looping
+RECEIVE_WAIT = 1
+
+# Line ending sent after commands on SSH shells
+DEFAULT_END_OF_LINE = b"\r\n"
+
+# Servers limit channels per connection (OpenSSH MaxSessions defaults to 10)
+SSH_MAX_CHANNELS = 10
+
+# Larger SFTP channel window keeps more pipelined writes in flight on high latency links
+SFTP_WINDOW_SIZE = 8 * 1024 * 1024
+
 
 class ConnectionError(Exception):
     pass
@@ -22,37 +44,63 @@ class CommandError(Exception):
 class Connection(object):
     __metaclass__ = ABCMeta
 
+    encoding = "utf-8"
+
+    @property
+    def prompt(self):
+        return self._prompt
+
+    @prompt.setter
+    def prompt(self, prompt):
+        self._prompt = prompt
+        # Prompt is matched against received bytes, encode it once
+        self.prompt_bytes = prompt.encode(self.encoding)
+
     @abstractmethod
     def run(self, command, timeout=5):
-        raise NotImplemented()
+        raise NotImplementedError()
 
     @abstractmethod
     def run_interactive(self, command, timeout=5, row_callback=None, end_of_line=None):
-        raise NotImplemented()
+        raise NotImplementedError()
 
     @abstractmethod
     def upload_file(self, buffer, filename):
-        raise NotImplemented()
+        raise NotImplementedError()
+
+    def upload_path(self, path, filename):
+        """
+        Upload local file from path
+        """
+        with open(path, 'rb') as f:
+            return self.upload_file(f, filename)
+
+    def upload_files(self, files):
+        """
+        Upload list of (local path, remote filename) tuples
+        """
+        for path, filename in files:
+            self.upload_path(path, filename)
 
     @abstractmethod
     def close(self):
-        raise NotImplemented()
+        raise NotImplementedError()
 
     @abstractmethod
     def reopen(self):
-        raise NotImplemented()
+        raise NotImplementedError()
 
     @abstractmethod
     def connect(self):
-        raise NotImplemented()
+        raise NotImplementedError()
 
     @abstractmethod
     def expect_disconnect(self):
-        raise NotImplemented()
+        raise NotImplementedError()
 
     @abstractmethod
     def get_address(self):
-        raise NotImplemented()
+        raise NotImplementedError()
 
 
 class Actions(Enum):
@@ -71,6 +119,92 @@ def cli_run_interactive(send_function, receive_function, binary_command, prompt,
     )
 
 
+def cli_run_interactive_block(send_function, receive_function, binary_commands, prompt, timeout=5,
+                              row_callback=None):
+    """
+    Send all commands at once and wait until prompt has been seen after each of them.
+    Prompt is counted only when it is followed by echo of next command, prompt character alone
+    may appear in command output.
+    """
+    send_function(b"".join(binary_commands))
+    return wait_prompt_with_callback(
+        send_function,
+        receive_function,
+        prompt,
+        timeout=timeout,
+        row_callback=row_callback,
+        min_input_length=len(binary_commands[0]) + 1,
+        echoes=[command.rstrip(b"\r\n") for command in binary_commands[1:]]
+    )
+
+
+# Read-only commands which never ask questions, only these are safe to send as type-ahead.
+# Otherwise next command in block would be taken as answer to question.
+BLOCK_SAFE_COMMANDS = ("show ", "sh ", "terminal ")
+
+
+def can_run_as_block(commands):
+    """
+    Returns True if all commands can be sent at once with cli_run_interactive_block
+    """
+    return all(command.strip().lower().startswith(BLOCK_SAFE_COMMANDS) for command in commands)
+
+
+def split_block_output(data, prompt, commands):
+    """
+    Split output of cli_run_interactive_block into per command outputs.
+    Outputs are separated by prompt rows ending with prompt followed by echo of next command.
+    """
+    out = [[]]
+    boundaries = [prompt + command for command in commands[1:]]
+    for row in data.splitlines():
+        if len(out) <= len(boundaries) and row.rstrip().endswith(boundaries[len(out) - 1]):
+            out.append([])
+            continue
+        out[-1].append(row)
+    return ["\n".join(rows) for rows in out]
+
+
+def read_until_prompt(receive_function, prompt, encoding="utf-8", nbytes=RECEIVE_SIZE):
+    """
+    Read until data ends with prompt, optionally followed by single space.
+    Only tail of the buffer is checked after each read and data is decoded once at the end.
+    """
+    prompt_bytes = prompt.encode(encoding) if isinstance(prompt, str) else prompt
+    suffixes = (prompt_bytes, prompt_bytes + b" ")
+    tail_length = len(prompt_bytes) + 1
+    buffer = bytearray()
+    while True:
+        # Reads block until data or timeout, empty read means connection was closed
+        chunk = receive_function(nbytes)
+        if not chunk:
+            raise ConnectionError("Connection closed while waiting for prompt")
+        buffer += chunk
+        if bytes(buffer[-tail_length:]).endswith(suffixes):
+            break
+    return buffer.decode(encoding, errors="replace")
+
+
+def trim_chunks(chunks, start):
+    """
+    Returns byte chunks with first start bytes and everything after last newline removed
+    """
+    first = 0
+    while first < len(chunks) and start >= len(chunks[first]):
+        start -= len(chunks[first])
+        first += 1
+    trimmed = chunks[first:]
+    if trimmed:
+        trimmed[0] = trimmed[0][start:]
+    while trimmed:
+        position = trimmed[-1].rfind(b"\n")
+        if position != -1:
+            trimmed[-1] = trimmed[-1][:position]
+            break
+        trimmed.pop()
+    return trimmed
+
+
 def wait_prompt_with_callback(
         send_function,
         receive_function,
@@ -78,33 +212,91 @@ def wait_prompt_with_callback(
         timeout=5,
         row_callback=None,
         min_input_length=0,
-        encoding="utf-8"
+        encoding="utf-8",
+        echoes=None
     ):
     at_prompt = False
-    data = ""
-    times_sleep = 0
+    # Received bytes are collected as chunks, joined and decoded only when text is needed
+    chunks = []
+    length = 0
+    idle_time = 0
+    # Prompt may be followed by single space
+    if isinstance(prompt, str):
+        prompt = prompt.encode(encoding)
+    prompt_suffixes = (prompt, prompt + b" ")
+    # Callbacks may declare strings they react to, skip chunks which can't contain them
+    triggers = getattr(row_callback, "triggers", None)
+    if triggers is not None:
+        triggers = [trigger.encode(encoding) for trigger in triggers]
+    trigger_overlap = max([len(x) for x in triggers], default=0) if triggers else 0
+    # End of previously received data, long enough for matches spanning chunks
+    tail = b""
+    # With multiple commands in flight, prompt followed by echo of next command separates outputs.
+    # Boundaries are searched in order, boundary_search_from is offset in whole data.
+    boundaries = [prompt + echo for echo in echoes or []]
+    boundaries_seen = 0
+    boundary_search_from = 0
+    tail_length = max(len(prompt) + 1, trigger_overlap, max([len(x) for x in boundaries], default=0))
+    # Offset of first row not yet passed to row_callback and whether callback acted on it
+    row_start = 0
+    row_answered = False
     while True:
-        logger.debug(f"Data received: {data}")
-        new_data = receive_function(8192)
-        if new_data:
-            data += new_data.decode(encoding, errors="ignore")
-        else:
-            # break
-            time.sleep(1)
-            times_sleep += 1
-            if times_sleep > timeout:
+        # Receive functions block until data arrives or connection timeout expires
+        started = time.monotonic()
+        new_data = receive_function(RECEIVE_SIZE)
+        if not new_data:
+            idle_time += time.monotonic() - started
+            if idle_time > timeout:
                 raise TimeoutError
-            logger.debug(f"No new data received")
+            logger.debug("No new data received")
             continue
-        if len(data) > min_input_length:
-            if data.endswith(prompt) or data.endswith(prompt + " "):
-                at_prompt = True
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Data received: {new_data}")
+        chunks.append(new_data)
+        length += len(new_data)
+        window = tail + new_data
+        tail = window[-tail_length:]
+        window_start = length - len(window)
+        while boundaries_seen < len(boundaries):
+            position = window.find(boundaries[boundaries_seen], max(0, boundary_search_from - window_start))
+            if position == -1:
                 break
+            boundary_search_from = window_start + position + len(boundaries[boundaries_seen])
+            boundaries_seen += 1
+        if length > min_input_length:
+            if tail.endswith(prompt_suffixes):
+                # Final prompt has to come after echo of last command
+                if boundaries_seen >= len(boundaries) and length > boundary_search_from:
+                    at_prompt = True
+                    break
             elif row_callback:
+                if triggers is not None:
+                    if not any(trigger in window[-(len(new_data) + trigger_overlap):] for trigger in triggers):
+                        continue
+                data = b"".join(chunks)
+                chunks = [data]
+                # Complete rows are passed to callback once. Unfinished last row, usually a question,
+                # is passed again as it grows until callback has acted on it.
+                complete_end = data.rfind(b"\n", row_start) + 1
+                rows = []
+                if complete_end:
+                    complete_rows = data[row_start:complete_end].decode(encoding, errors="ignore").splitlines()
+                    if row_answered:
+                        complete_rows = complete_rows[1:]
+                    rows.extend((row, False) for row in complete_rows)
+                    row_start = complete_end
+                    row_answered = False
+                if not row_answered:
+                    rows.append((data[row_start:].decode(encoding, errors="ignore"), True))
                 break_out = False
-                for row in data.strip().splitlines():
+                for row, unfinished in rows:
+                    row = row.strip()
+                    if not row:
+                        continue
                     action = row_callback(row)
-                    logger.debug(f"Row '{row}' callback action {action}")
+                    logger.debug("Row '%s' callback action %s", row, action)
+                    if action is not None and unfinished:
+                        row_answered = True
                     if action == Actions.BREAK:
                         break_out = True
                         break
@@ -114,10 +306,12 @@ def wait_prompt_with_callback(
                         send_function(action.encode(encoding))
                 if break_out:
                     break
-    # Strip prompts from data
     if at_prompt:
-        data = data[min_input_length:data.rfind("\n")]
-    logger.debug(f"Input data:\n{data}")
+        # Strip echoed command and prompt row before joining so output is copied once
+        chunks = trim_chunks(chunks, min_input_length)
+    data = b"".join(chunks).decode(encoding, errors="ignore")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Input data:\n{data}")
     logger.debug(f"At prompt {at_prompt}")
     return data, at_prompt
 
@@ -134,12 +328,13 @@ class TelnetConnection(Connection):
         self._password = password
         self._connection = None
         self._login_dialog = login_dialog
+        self.encoding = "utf-8"
         self.prompt = prompt
         self._initial_prompt = prompt
         self._at_prompt = False
         self._channel = None
         self.end_of_line = "\r\n"
-        self.encoding = "utf-8"
+        self.session_initialized = False
 
     @property
     def channel(self):
@@ -148,6 +343,7 @@ class TelnetConnection(Connection):
         return self._channel
 
     def connect(self):
+        self.session_initialized = False
         logger.info(f"Connecting to {self.address}:{self.port}")
         res = socket.getaddrinfo(self.address, self.port, socket.AF_INET, socket.SOCK_STREAM)
         if len(res) < 1:
@@ -165,6 +361,9 @@ class TelnetConnection(Connection):
         try:
             self.set_timeout(30)
             self._channel.connect(sa)
+            set_nodelay(self._channel)
+            # Telnet has no keepalive of its own
+            set_tcp_keepalive(self._channel)
             logger.info(f"Connected to {self.address}:{self.port}")
             self.set_timeout(None)
         except OSError:
@@ -205,7 +404,26 @@ class TelnetConnection(Connection):
             self._send,
             self._receive,
             binary_command + end_of_line,
-            self.prompt,
+            self.prompt_bytes,
+            timeout=timeout,
+            row_callback=row_callback
+        )
+        self.set_timeout(None)
+        return data
+
+    def run_interactive_block(self, commands, timeout=5, row_callback=None, end_of_line=None):
+        if not end_of_line:
+            end_of_line = self.end_of_line
+        end_of_line = end_of_line.encode(self.encoding)
+        logger.debug("Telnet Interactive Commands: %s", commands)
+        self._wait_prompt(timeout=timeout)
+
+        self.set_timeout(timeout)
+        data, self._at_prompt = cli_run_interactive_block(
+            self._send,
+            self._receive,
+            [command.encode(self.encoding) + end_of_line for command in commands],
+            self.prompt_bytes,
             timeout=timeout,
             row_callback=row_callback
         )
@@ -213,7 +431,7 @@ class TelnetConnection(Connection):
         return data
 
     def upload_file(self, buffer, filename):
-        raise NotImplemented()
+        raise NotImplementedError()
 
     def close(self):
         if self._channel:
@@ -230,40 +448,128 @@ class TelnetConnection(Connection):
         self.reopen()
 
     def _send(self, command):
-        logger.debug(f"Raw output: {command}")
+        logger.debug("Raw output: %r", command)
         self._channel.sendall(command)
 
     def _receive(self, nbytes):
         data = self._channel.recv(nbytes)
-        logger.debug(f"Raw input: {data}")
+        logger.debug("Raw input: %r", data)
+        if not data:
+            # Connection closed, don't spin
+            time.sleep(RECEIVE_WAIT)
         return data
 
     def _wait_prompt(self, timeout=5, prompt=None):
         logger.debug(f"wait_prompt: at_prompt: {self._at_prompt}")
         if self._at_prompt:
             return
-        data = ""
         if not prompt:
             prompt = self.prompt
         logger.debug(f"Waiting for prompt '{prompt}'")
         self.set_timeout(timeout)
-        while True:
-            char = self.channel.recv(len(self.prompt))
-            if len(char) == 0:
-                time.sleep(0.1)
-                continue
-            data += char.decode(self.encoding, errors="replace")
-            logger.debug(f"prompt data {data.encode(self.encoding)}")
-            if data.endswith(prompt) or data.endswith(prompt + " "):
-                break
+        data = read_until_prompt(self.channel.recv, prompt, encoding=self.encoding)
         self.set_timeout(None)
         self._at_prompt = True
-        logger.debug(f"prompt: '{data.encode(self.encoding)}'")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"prompt: '{data.encode(self.encoding)}'")
 
     def set_timeout(self, timeout):
         self.channel.settimeout(timeout)
 
 
+_known_host_keys = None
+_known_host_keys_lock = threading.Lock()
+
+
+def known_host_keys():
+    """
+    Returns ~/.ssh/known_hosts loaded once per process
+    """
+    global _known_host_keys
+    with _known_host_keys_lock:
+        if _known_host_keys is None:
+            host_keys = paramiko.HostKeys()
+            path = os.path.expanduser('~/.ssh/known_hosts')
+            if os.path.isfile(path):
+                host_keys.load(path)
+            _known_host_keys = host_keys
+        return _known_host_keys
+
+
+class SSHClientPool(object):
+    """
+    Shares authenticated SSH clients between connections to same host and user.
+    Clients are reference counted and closed when last user releases them.
+    Each client comes with semaphore limiting channels opened concurrently over its transport
+    and one lazily opened SFTP session shared by its users.
+    """
+
+    def __init__(self, max_channels=SSH_MAX_CHANNELS):
+        self.max_channels = max_channels
+        self._lock = threading.Lock()
+        # key -> [client, refcount, channel semaphore, sftp]
+        self._clients = {}
+        # key -> lock held while client for key is created, so concurrent users share one handshake
+        self._key_locks = {}
+
+    def acquire(self, key, factory):
+        """
+        Returns (client, channel semaphore) tuple
+        """
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._clients.get(key)
+                if entry:
+                    transport = entry[0].get_transport()
+                    if transport and transport.is_active():
+                        entry[1] += 1
+                        logger.debug(f"Reusing SSH transport to {key}, users: {entry[1]}, pooled: {len(self._clients)}")
+                        return entry[0], entry[2]
+            client = factory()
+            channels = threading.BoundedSemaphore(self.max_channels)
+            with self._lock:
+                # Possible stale client is closed by its remaining users
+                self._clients[key] = [client, 1, channels, None]
+                logger.debug(f"New SSH transport to {key}, pooled: {len(self._clients)}")
+        return client, channels
+
+    def sftp(self, key, client):
+        """
+        Returns SFTP session shared by users of client, None if client isn't pooled
+        """
+        with self._lock:
+            entry = self._clients.get(key)
+            if not entry or entry[0] is not client:
+                return None
+            if entry[3]:
+                return entry[3]
+        sftp = paramiko.SFTPClient.from_transport(client.get_transport(), window_size=SFTP_WINDOW_SIZE)
+        with self._lock:
+            if entry[3] is None:
+                entry[3] = sftp
+                return sftp
+        # Another user opened one meanwhile
+        sftp.close()
+        return entry[3]
+
+    def release(self, key, client):
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry and entry[0] is client:
+                entry[1] -= 1
+                if entry[1] > 0:
+                    return
+                del self._clients[key]
+                if entry[3]:
+                    entry[3].close()
+        client.close()
+
+
+SSH_CLIENT_POOL = SSHClientPool()
+
+
 class SSHConnection(Connection):
     def __init__(
             self,
@@ -284,10 +590,12 @@ class SSHConnection(Connection):
         self._key_password = key_password
         self._sftp = None
         self._connection = None
+        self._channel_slots = None
         self.prompt = prompt
         self._initial_prompt = prompt
         self._channel = None
         self._at_prompt = False
+        self.session_initialized = False
 
         if 'SSH_AUTH_SOCK' in os.environ:
             del os.environ['SSH_AUTH_SOCK']
@@ -304,11 +612,9 @@ class SSHConnection(Connection):
     def _connect(self):
         logger.debug(f"Opening new SSH connection to {self._username}@{self.address}:{self.port}")
         connection = paramiko.SSHClient()
-        if os.path.isfile(os.path.expanduser('~/.ssh/known_hosts')):
-            connection.load_host_keys(os.path.expanduser('~/.ssh/known_hosts'))
-        connection.set_missing_host_key_policy(
-            paramiko.AutoAddPolicy())
-        connection._policy = paramiko.WarningPolicy()
+        # Shared read-only known hosts, unknown keys are only warned about and never written
+        connection._host_keys = known_host_keys()
+        connection.set_missing_host_key_policy(paramiko.WarningPolicy())
         kwargs = {
             'username': self._username,
             "allow_agent": False,
@@ -342,44 +648,118 @@ class SSHConnection(Connection):
         except socket.timeout as exc:
             raise ConnectionError(f"Failed top open SSH connection to "
                                   f"{self._username}@{self.address}:{self.port}: {exc}")
+        transport = connection.get_transport()
+        # Keep idle pooled connections open
+        transport.set_keepalive(SSH_KEEPALIVE_INTERVAL)
+        set_nodelay(transport.sock)
+        set_tcp_keepalive(transport.sock)
         logger.debug("New SSH connection to %s@%:%d is now open", self._username, self.address, self.port)
         return connection
 
+    @property
+    def _pool_key(self):
+        return self.address, self.port, self._username
+
     def connect(self):
-        self._connection = self._connect()
+        self.session_initialized = False
+        if self._connection:
+            transport = self._connection.get_transport()
+            if transport and transport.is_active():
+                # Already holding live pooled client, acquiring it again would never be released
+                return
+            self.close()
+        self._connection, self._channel_slots = SSH_CLIENT_POOL.acquire(self._pool_key, self._connect)
 
     @property
     def sftp(self):
+        sftp = SSH_CLIENT_POOL.sftp(self._pool_key, self.connection)
+        if sftp:
+            return sftp
+        # Client dropped from pool, use private session
         if not self._sftp:
-            self._sftp = paramiko.SFTPClient.from_transport(self.connection.get_transport())
+            self._sftp = paramiko.SFTPClient.from_transport(
+                self.connection.get_transport(), window_size=SFTP_WINDOW_SIZE
+            )
         return self._sftp
 
     def upload_file(self, buffer, filename):
         return self.sftp.putfo(buffer, filename)
 
+    def upload_path(self, path, filename):
+        # Streams file with pipelined writes and known file size
+        return self.sftp.put(path, filename)
+
+    def upload_files(self, files, max_workers=4):
+        """
+        Upload list of (local path, remote filename) tuples in parallel,
+        each over its own SFTP channel on the same transport
+        """
+        if len(files) < 2:
+            return super().upload_files(files)
+
+        def upload(path, filename):
+            with self._channel_slots:
+                sftp = paramiko.SFTPClient.from_transport(self.connection.get_transport(), window_size=SFTP_WINDOW_SIZE)
+                try:
+                    sftp.put(path, filename)
+                finally:
+                    sftp.close()
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as executor:
+            futures = [executor.submit(upload, path, filename) for path, filename in files]
+            for future in as_completed(futures):
+                # Raises first failed upload
+                future.result()
+
     def run(self, command, timeout=5):
         logger.debug("SSH Command: %s", command)
-        response = self.connection.exec_command(command, timeout=timeout)
-        stderr = response[2].read().decode("utf-8")
-        stdout = response[1].read().decode("utf-8")
-        return stdout, stderr
+        # Exec channels are multiplexed over shared transport, stay below server session limit
+        connection = self.connection
+        with self._channel_slots:
+            response = connection.exec_command(command, timeout=timeout)
+            stdout, stderr = read_channel(response[1].channel, timeout=timeout)
+        return stdout.decode("utf-8"), stderr.decode("utf-8")
 
     def close(self):
-        self.connection.close()
+        if not self._connection:
+            return
+        self.close_channel()
+        if self._sftp:
+            self._sftp.close()
+            self._sftp = None
+        SSH_CLIENT_POOL.release(self._pool_key, self._connection)
+        self._connection = None
 
     def reopen(self, timeout=900):
-        time_start = time.time()
-        if wait_connection(self.address, self.port, timeout=timeout):
+        deadline = time.monotonic() + timeout
+        # Probe port before each attempt instead of retrying SSH handshakes in tight loop
+        while wait_connection(self.address, self.port, timeout=max(0, deadline - time.monotonic())):
             logger.info("Reconnecting to %s:%d" % (self.address, self.port))
-            while time.time() - timeout < time_start:
-                try:
-                    self._connection = self._connect()
-                    return self
-                except ConnectionError as exc:
-                    logger.debug("Creating new connection failed: %s" % exc)
+            try:
+                self.connect()
+                return self
+            except ConnectionError as exc:
+                logger.debug("Creating new connection failed: %s" % exc)
+            time.sleep(max(0, min(5, deadline - time.monotonic())))
         raise ConnectionError("Failed to reopen connection: timeout")
 
+    def is_alive(self):
+        """
+        Returns False once device has closed SSH transport or shell channel, for example when reloading
+        """
+        if not self._connection:
+            return False
+        transport = self._connection.get_transport()
+        if not transport or not transport.is_active():
+            return False
+        if self._channel and (self._channel.closed or self._channel.eof_received):
+            return False
+        return True
+
     def expect_disconnect(self, timeout=900):
+        """
+        Device is going down, release pooled transport and open new one once device is back
+        """
         self.close_channel()
         self.close()
         time.sleep(5)
@@ -401,15 +781,15 @@ class SSHConnection(Connection):
         self.channel.settimeout(timeout)
 
     def _receive(self, nbytes):
-        data = b""
-        if self.channel.recv_ready():
-            time.sleep(0.2)
-            new_data = self.channel.recv(nbytes=nbytes)
-            data += new_data
-        elif self.channel.recv_stderr_ready():
-            time.sleep(0.2)
-            new_data = self.channel.recv_stderr(nbytes=nbytes)
-            data += new_data
+        # Blocks until data arrives or channel timeout set by caller expires.
+        # Shell channel has a pty, stderr is merged to stdout.
+        try:
+            data = self.channel.recv(nbytes)
+        except socket.timeout:
+            return b""
+        if not data:
+            # Channel closed, don't spin
+            time.sleep(RECEIVE_WAIT)
         return data
 
     def _send(self, data):
@@ -418,20 +798,15 @@ class SSHConnection(Connection):
     def _wait_prompt(self, timeout=5, prompt=None):
         if self._at_prompt:
             return
-        data = ""
         if not prompt:
             prompt = self.prompt
         logger.debug(f"Waiting for prompt '{prompt}'")
         self.set_timeout(timeout)
-        while True:
-            char = self.channel.recv(nbytes=len(self.prompt))
-            data += char.decode("utf-8")
-            logger.debug(f"prompt data {data.encode('utf-8')}")
-            if data.endswith(prompt) or data.endswith(prompt + " "):
-                break
+        data = read_until_prompt(self.channel.recv, prompt)
         self.set_timeout(None)
         self._at_prompt = True
-        logger.debug(f"prompt: '{data.encode('utf-8')}'")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"prompt: '{data.encode('utf-8')}'")
 
     def set_prompt(self, prompt):
         self.prompt = prompt
@@ -440,9 +815,7 @@ class SSHConnection(Connection):
         self.prompt = self._initial_prompt
 
     def run_interactive(self, command, timeout=5, row_callback=None, end_of_line=None, dry_run=False):
-        if not end_of_line:
-            end_of_line = "\r\n"
-        end_of_line = end_of_line.encode("utf-8")
+        end_of_line = end_of_line.encode("utf-8") if end_of_line else DEFAULT_END_OF_LINE
         logger.debug("SSH Interactive Command: %s", command)
         if dry_run:
             return None
@@ -454,7 +827,28 @@ class SSHConnection(Connection):
             self._send,
             self._receive,
             binary_command + end_of_line,
-            self.prompt,
+            self.prompt_bytes,
+            timeout=timeout,
+            row_callback=row_callback
+        )
+        self.set_timeout(None)
+
+        return data
+
+    def run_interactive_block(self, commands, timeout=5, row_callback=None, end_of_line=None, dry_run=False):
+        end_of_line = end_of_line.encode("utf-8") if end_of_line else DEFAULT_END_OF_LINE
+        logger.debug("SSH Interactive Commands: %s", commands)
+        if dry_run:
+            return None
+        self._wait_prompt(timeout=timeout)
+        self.set_timeout(timeout)
+
+        data, self._at_prompt = cli_run_interactive_block(
+            self._send,
+            self._receive,
+            [command.encode("utf-8") + end_of_line for command in commands],
+            self.prompt_bytes,
+            timeout=timeout,
             row_callback=row_callback
         )
         self.set_timeout(None)
@@ -471,22 +865,56 @@ class SSHConnection(Connection):
     def get_address(self):
         return self.address
 
+
+def read_channel(channel, timeout=5, nbytes=RECEIVE_SIZE):
+    """
+    Read stdout and stderr of exec channel as they arrive until end of file.
+    Raises socket.timeout if channel stays silent for timeout seconds.
+    """
+    stdout = bytearray()
+    stderr = bytearray()
+    while True:
+        if channel.recv_ready():
+            stdout += channel.recv(nbytes)
+        elif channel.recv_stderr_ready():
+            stderr += channel.recv_stderr(nbytes)
+        elif channel.eof_received or channel.closed:
+            break
+        else:
+            readable, _, _ = select.select([channel], [], [], timeout)
+            if not readable:
+                raise socket.timeout(f"No data from channel in {timeout} seconds")
+    return bytes(stdout), bytes(stderr)
+
+
+# Inventory option -> connection argument
+CONNECTION_OPTS = {
+    'password': "password",
+    'username': "username",
+    'port': "port",
+    "ssh_key_password": 'key_password',
+    'prompt': 'prompt',
+}
+
+# Inventory option -> connection argument, values are paths
+CONNECTION_PATH_OPTS = {
+    "ssh_key": 'key_filename',
+}
+
+
 def connection_from_opts(opts, login_dialog=None):
-    method = 'ssh'
     kwargs = {
         'address': opts["hostname"],
         'login_dialog': login_dialog,
     }
-    for key, value in {'password': "password", 'username': "username", 'port': "port",
-                       "ssh_key_password": 'key_password', 'prompt': 'prompt'}.items():
+    for key, value in CONNECTION_OPTS.items():
         if key in opts:
             kwargs[value] = opts[key]
-    for key, value in {"ssh_key": 'key_filename'}.items():
+    for key, value in CONNECTION_PATH_OPTS.items():
         if key in opts:
             kwargs[value] = os.path.expanduser(opts[key])
 
-    if 'method' in opts:
-        method = opts['method']
+    method = opts.get('method', 'ssh')
 
     if method == 'ssh':
         return SSHConnection(**kwargs)
@@ -495,42 +923,100 @@ def connection_from_opts(opts, login_dialog=None):
     raise ValueError(f"Invalid method {method}")
 
 
-def check_connection(address, port=22):
+def set_nodelay(sock):
+    """
+    Disable Nagle's algorithm, interactive sessions send small writes and wait for response
+    """
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (AttributeError, OSError) as exc:
+        logger.debug(f"Failed to set TCP_NODELAY: {exc}")
+
+
+def set_tcp_keepalive(sock):
     """
-    Check TCP connection
+    Enable TCP keepalive so half-open sessions to rebooting devices are detected by the OS
     """
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.settimeout(5)
     try:
-        sock.connect((address, port))
-    except socket.timeout:
-        sock.settimeout(None)
-        sock.close()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    except (AttributeError, OSError) as exc:
+        logger.debug(f"Failed to set SO_KEEPALIVE: {exc}")
+
+
+def check_connection(address, port=22, timeout=5):
+    """
+    Check TCP connection.
+    Non-blocking connect is polled against single deadline shared by all resolved addresses.
+    """
+    deadline = time.monotonic() + timeout
+    try:
+        addresses = socket.getaddrinfo(address, port, type=socket.SOCK_STREAM)
+    except OSError:
         return False
-    except ConnectionRefusedError:
-        sock.settimeout(None)
-        sock.close()
+    for family, socktype, proto, _, sockaddr in addresses:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        with socket.socket(family, socktype, proto) as sock:
+            sock.setblocking(False)
+            error = sock.connect_ex(sockaddr)
+            if error in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                _, writable, _ = select.select([], [sock], [], remaining)
+                if not writable:
+                    continue
+                error = sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error == 0:
+                return True
+    return False
+
+
+async def check_connection_async(address, port=22, timeout=5):
+    """
+    Check TCP connection without blocking event loop
+    """
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout=timeout)
+    except (asyncio.TimeoutError, OSError):
         return False
+    writer.close()
+    try:
+        await writer.wait_closed()
     except OSError:
-        sock.settimeout(None)
-        sock.close()
-        return False
-    sock.settimeout(None)
-    sock.close()
+        pass
     return True
 
 
-def wait_connection(address, port=22, timeout=900):
+async def wait_connection_async(address, port=22, timeout=900):
     """
     Wait for service to become available on given ip and port
     """
-    rounds = timeout // 10
-    for i in range(rounds):
-        if check_connection(address, port):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    i = 0
+    while loop.time() < deadline:
+        if await check_connection_async(address, port):
             logger.info(f"Connection to {address}:{port} is open")
             return True
         # To prevent accidental busy loops
-        time.sleep(5)
+        await asyncio.sleep(max(0, min(5, deadline - loop.time())))
         if i % 5 == 0:
             logger.info(f"Waiting for {address}:{port} to respond")
+        i += 1
     return False
+
+
+def wait_connection(address, port=22, timeout=900):
+    """
+    Wait for service to become available on given ip and port
+    """
+    return asyncio.run(wait_connection_async(address, port, timeout=timeout))
+
+
+def wait_connections(targets, timeout=900):
+    """
+    Wait for multiple (address, port) targets concurrently in single event loop.
+    Returns list of results in same order as targets.
+    """
+    async def wait_all():
+        return await asyncio.gather(*[wait_connection_async(address, port, timeout=timeout) for address, port in targets])
+    return asyncio.run(wait_all())
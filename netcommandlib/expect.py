@@ -1,8 +1,25 @@
+import re
+
 
 def expect_strings(answers):
+    """
+    Returns row callback answering to rows containing any of answers keys.
+    Keys are matched with a single precompiled regex.
+    """
+    keys = list(answers.keys())
+    if not keys:
+        def no_answers(row):
+            return None
+        no_answers.triggers = []
+        return no_answers
+    pattern = re.compile("|".join(f"(?P<a{i}>{re.escape(key)})" for i, key in enumerate(keys)))
+    replies = {f"a{i}": answers[key] for i, key in enumerate(keys)}
+
     def expect_handler(row):
-        for answer in answers.keys():
-            if answer in row:
-                return answers[answer]
+        match = pattern.search(row)
+        if match:
+            return replies[match.lastgroup]
         return None
+    # Let connection skip scanning output which can't contain any of the keys
+    expect_handler.triggers = keys
     return expect_handler
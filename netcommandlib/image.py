@@ -1,4 +1,5 @@
 import io
+import mmap
 import os
 
 
@@ -7,6 +8,12 @@ class GenericImage(object):
         self.platform = platform
         self.version = version
 
+    def transfer_to(self, model, dry_run=False):
+        """
+        Transfer image to device managed by model
+        """
+        raise NotImplementedError(f"Image type {type(self)} not implemented")
+
 
 class LocalImage(GenericImage):
     def __init__(self, path, version, platform):
@@ -14,11 +21,18 @@ class LocalImage(GenericImage):
         self.path = path
         self.filename = os.path.basename(self.path)
 
+    def transfer_to(self, model, dry_run=False):
+        return model.upload_image(self, dry_run=dry_run)
+
     def as_bytes(self):
+        """
+        Returns read-only file-like memory map of image, data is paged in on demand
+        """
         with open(self.path, 'rb') as f:
-            buffer = io.BytesIO(f.read())
-            buffer.seek(0)
-            return buffer
+            if os.fstat(f.fileno()).st_size == 0:
+                # Empty files can't be mapped
+                return io.BytesIO()
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
 
 class NetworkImage(GenericImage):
@@ -48,5 +62,8 @@ class NetworkImage(GenericImage):
 
 
 class HTTPImage(NetworkImage):
+    def transfer_to(self, model, dry_run=False):
+        return model.download_image(self, dry_run=dry_run)
+
     def validate_protocol(self):
         return self.protocol in ["http", "https"]
\ No newline at end of file
@@ -1,42 +1,112 @@
-import glob
+import fnmatch
 import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import requests as requests
+from requests.adapters import HTTPAdapter
 
 from netcommandlib.connection import SSHConnection
 from netcommandlib import image
 
 logger = logging.getLogger("image_provider")
 
+# Hosts are processed in parallel, keep enough pooled connections for all workers
+HTTP_POOL_SIZE = 16
+HTTP_TIMEOUT = 10
+
 
 class ImageProvider(object):
     type = "generic"
 
-    def find_image(self, filename):
-        raise NotImplemented()
-
-
-class LocalImageProvider(object):
+    def find_image(self, filename, **kwargs):
+        raise NotImplementedError()
+
+    def _cached_exists(self, key, check):
+        """
+        Returns memoized result of check() for key, providers are shared by all hosts
+        """
+        with self._lock:
+            exists = self._exists_cache.get(key)
+        if exists is None:
+            exists = check()
+            with self._lock:
+                self._exists_cache[key] = exists
+        return exists
+
+    def find_images(self, filenames, **kwargs):
+        """
+        Returns dict of filename -> image for filenames found from provider
+        """
+        images = {}
+        for filename in filenames:
+            found = self.find_image(filename, **kwargs)
+            if found:
+                images[filename] = found
+        return images
+
+    def close(self):
+        """
+        Release connections held by provider
+        """
+        pass
+
+
+class LocalImageProvider(ImageProvider):
     type = "local"
 
     def __init__(self, directory):
         self.directory = os.path.expanduser(directory)
+        self._lock = threading.Lock()
+        # (directory mtime, file names), listing is shared by all hosts
+        self._listing = None
+
+    def refresh(self):
+        """
+        Drop cached directory listing
+        """
+        with self._lock:
+            self._listing = None
+
+    def _entries(self):
+        """
+        Returns file names in directory, listed again only when directory has changed
+        """
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            return []
+        with self._lock:
+            if self._listing and self._listing[0] == mtime:
+                return self._listing[1]
+        with os.scandir(self.directory) as it:
+            entries = [x.name for x in it if not x.name.startswith(".")]
+        with self._lock:
+            self._listing = (mtime, entries)
+        return entries
 
     def find_image(self, filename, **kwargs):
-        files = glob.glob(os.path.join(self.directory, filename))
-
-        if len(files) == 0:
-            logger.error(f"LocalImageProvider: Failed to find upgrade image {filename}")
-            return None
-        elif len(files) > 1:
-            logger.error(f"LocalImageProvider: Multiple files found matching {filename} in path {self.directory}")
-            return None
-
-        return image.LocalImage(path=files[0], **kwargs)
+        return self.find_images([filename], **kwargs).get(filename)
 
-
-class HTTPImageProvider(object):
+    def find_images(self, filenames, **kwargs):
+        try:
+            entries = self._entries()
+        except OSError:
+            entries = []
+        images = {}
+        for filename in filenames:
+            files = fnmatch.filter(entries, filename)
+            if len(files) == 0:
+                logger.error(f"LocalImageProvider: Failed to find upgrade image {filename}")
+            elif len(files) > 1:
+                logger.error(f"LocalImageProvider: Multiple files found matching {filename} in path {self.directory}")
+            else:
+                images[filename] = image.LocalImage(path=os.path.join(self.directory, files[0]), **kwargs)
+        return images
+
+
+class HTTPImageProvider(ImageProvider):
     type = "http"
 
     def __init__(self, server, path="", port=80,  username=None, password=None, protocol="http"):
@@ -46,15 +116,28 @@ class HTTPImageProvider(object):
         self.path = path.strip("/")
         self.port = port
         self.protocol = protocol
+        # Keeps connections to server open between lookups, urllib3 already sets TCP_NODELAY
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._exists_cache = {}
+        self._lock = threading.Lock()
 
     def check_exists(self, url):
-        r = requests.head(url=url)
+        return self._cached_exists(url, lambda: self._check_exists(url))
+
+    def _check_exists(self, url):
+        r = self._session.head(url=url, timeout=HTTP_TIMEOUT)
 
         logger.debug(f"URL {url} returned {r.status_code}")
         if r.status_code == 200:
             return True
         return False
 
+    def close(self):
+        self._session.close()
+
     def find_image(self, filename, **kwargs):
         auth = ""
         if self.username and self.password:
@@ -85,16 +168,42 @@ class SCPImageProvider(ImageProvider):
         self.path = path.strip("/")
         self.port = port
         self.protocol = self.type
+        self._exists_cache = {}
+        self._lock = threading.Lock()
+        # Probe connection is opened once and reused for all lookups
+        self._probe_connection = None
+
+    def _connection(self):
+        with self._lock:
+            if self._probe_connection is not None:
+                transport = self._probe_connection.connection.get_transport()
+                if not transport or not transport.is_active():
+                    logger.debug(f"SCP probe connection to {self.server} lost, reconnecting")
+                    self._probe_connection.close()
+                    self._probe_connection = None
+            if self._probe_connection is None:
+                self._probe_connection = SSHConnection(
+                    self.server, username=self.username, password=self.password, port=self.port
+                )
+            return self._probe_connection
 
     def check_exists(self, url, filename):
-        connection = SSHConnection(self.server, username=self.username, password=self.password, port=self.port)
+        return self._cached_exists(filename, lambda: self._check_exists(url, filename))
+
+    def _check_exists(self, url, filename):
         try:
-            stat = connection.sftp.stat(filename)
+            stat = self._connection().sftp.stat(filename)
             logger.debug(f"SCP {url} returned {stat}")
             return True
         except FileNotFoundError:
             return False
 
+    def close(self):
+        with self._lock:
+            connection, self._probe_connection = self._probe_connection, None
+        if connection:
+            connection.close()
+
     def find_image(self, filename, **kwargs):
         auth = ""
         if self.username and self.password:
@@ -108,6 +217,29 @@ class SCPImageProvider(ImageProvider):
                                   port=self.port, username=self.username, password=self.password, **kwargs)
 
 
+def find_images_any(providers, filenames, **kwargs):
+    """
+    Returns dict of filename -> image looked up from all providers concurrently.
+    When multiple providers have same file, first provider in list wins.
+    """
+    images = {}
+    if not providers or not filenames:
+        return images
+    if len(providers) == 1:
+        return providers[0].find_images(filenames, **kwargs)
+    with ThreadPoolExecutor(max_workers=len(providers)) as executor:
+        futures = [executor.submit(provider.find_images, filenames, **kwargs) for provider in providers]
+        for i, future in enumerate(futures):
+            for filename, found_image in future.result().items():
+                images.setdefault(filename, found_image)
+            if all(filename in images for filename in filenames):
+                # Lower priority providers are not needed anymore
+                for remaining in futures[i + 1:]:
+                    remaining.cancel()
+                break
+    return images
+
+
 IMAGE_PROVIDERS = {
     "local": LocalImageProvider,
     "http": HTTPImageProvider,
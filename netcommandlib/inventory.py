@@ -1,4 +1,5 @@
 import logging
+from collections import ChainMap
 
 logger = logging.getLogger("inventory")
 
@@ -9,6 +10,7 @@ class Inventory(object):
         self.hosts = {}
         self.groups = {}
         self.sources = {}
+        self._group_index = {}
 
     @classmethod
     def load_from_dict(cls, inventory):
@@ -17,46 +19,62 @@ class Inventory(object):
         inv.hosts = hosts["hosts"]
         inv.groups = hosts["groups"]
         inv.sources = inventory.get("sources", {})
+        inv._group_index = cls._build_group_index(inv.hosts)
         return inv
 
+    @staticmethod
+    def _build_group_index(hosts):
+        """
+        Returns group name -> set of hostnames in group or its subgroups
+        """
+        index = {}
+        for hostname, opts in hosts.items():
+            for group in opts["groups"]:
+                index.setdefault(group, set()).add(hostname)
+        return index
+
     @classmethod
     def _load_group(cls, inventory, path=None, parent_opts=None):
+        """
+        Walks group tree iteratively. Group options are merged once per group and
+        hosts get a ChainMap over their own items and the group options.
+        Hosts of a group are added after hosts of its subgroups.
+        """
         hosts = {"hosts": {}, "groups": {}}
-        if not path:
-            path = []
-        if parent_opts is None:
-            parent_opts = {}
-        opts = {}
-        opts.update(parent_opts)
-        opts.update(inventory.get("opts", {}))
-        for group_name, items in inventory.get("groups", {}).items():
-            group_data = cls._load_group(items, path + [group_name], parent_opts=opts)
-            hosts["hosts"].update(group_data["hosts"])
-            hosts["groups"].update(group_data["groups"])
-        for hostname, items in inventory.get("hosts", {}).items():
+        opts = {**(parent_opts or {}), **inventory.get("opts", {})}
+        # Frames of (group, path, merged opts, iterator over subgroups)
+        stack = [(inventory, path or [], opts, iter(inventory.get("groups", {}).items()))]
+        while stack:
+            group, group_path, group_opts, subgroups = stack[-1]
+            for group_name, items in subgroups:
+                child_opts = {**group_opts, **items.get("opts", {})}
+                stack.append((items, group_path + [group_name], child_opts, iter(items.get("groups", {}).items())))
+                break
+            else:
+                stack.pop()
+                cls._load_hosts(hosts["hosts"], group, group_path, group_opts)
+        return hosts
+
+    @staticmethod
+    def _load_hosts(hosts, group, path, opts):
+        for hostname, items in group.get("hosts", {}).items():
             # this is a host
-            if items is None:
-                items = {}
-            host_items = {}
-            host_items.update(opts)
-            host_items.update(items)
-            if 'hostname' not in host_items:
+            host_items = dict(items or {})
+            if 'hostname' not in host_items and 'hostname' not in opts:
                 host_items["hostname"] = hostname
             host_items["groups"] = path
-            hosts["hosts"][hostname] = host_items
-        return hosts
+            hosts[hostname] = ChainMap(host_items, opts)
 
     def filter_hosts(self, global_filter):
-        out = {}
-        for hostname, opts in self.hosts.items():
-            found = False
-            if hostname in global_filter:
-                found = True
-            for group in opts["groups"]:
-                if group in global_filter:
-                    found = True
-            if not found:
+        """
+        Returns only hosts matching global_filter by hostname or group
+        """
+        global_filter = set(global_filter)
+        matched = global_filter & self.hosts.keys()
+        for name in global_filter:
+            matched |= self._group_index.get(name, set())
+        if logger.isEnabledFor(logging.DEBUG):
+            for hostname in self.hosts.keys() - matched:
                 logger.debug(f"Skipping host {hostname}, don't match limit")
-                continue
-            out[hostname] = opts
-        return out
+        # Keep inventory order
+        return {hostname: opts for hostname, opts in self.hosts.items() if hostname in matched}
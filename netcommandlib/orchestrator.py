@@ -0,0 +1,64 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from netcommandlib.upgrade import generic_upgrade
+
+logger = logging.getLogger("orchestrator")
+
+
+def _run_all(calls, name, max_workers):
+    """
+    Run (key, callable) pairs in a thread pool.
+    Returns dict of key -> result. Exceptions are logged and returned in place of result.
+    """
+    results = {}
+    if not calls:
+        return results
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(calls))) as executor:
+        futures = {executor.submit(call): key for key, call in calls}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                results[key] = future.result()
+            except Exception as exc:
+                logger.exception(f"{key}: {name} failed: {exc}")
+                results[key] = exc
+    return results
+
+
+def run_in_parallel(models, method_name, *args, max_workers=32, **kwargs):
+    """
+    Call method_name on every model in a thread pool.
+    Returns dict of hostname -> result. Exceptions are logged and returned in place of result.
+    """
+    calls = [
+        (model.hostname, lambda model=model: getattr(model, method_name)(*args, **kwargs))
+        for model in models
+    ]
+    return _run_all(calls, method_name, max_workers)
+
+
+def upgrade_many(models, image, extra_images=None, dry_run=False, max_workers=32):
+    """
+    Upgrade multiple devices with same image concurrently
+    """
+    return run_in_parallel(
+        models, "upgrade", image, extra_images or [], dry_run=dry_run, max_workers=max_workers
+    )
+
+
+def generic_upgrade_many(items, dry_run=False, max_workers=32):
+    """
+    Run generic_upgrade concurrently for (hostname, model, image, extra_images) items.
+    Returns dict of hostname -> result. Exceptions are logged and returned in place of result.
+    """
+    calls = [
+        (
+            hostname,
+            lambda hostname=hostname, model=model, image=image, extra_images=extra_images: generic_upgrade(
+                hostname, model, image, extra_images or [], dry_run=dry_run
+            ),
+        )
+        for hostname, model, image, extra_images in items
+    ]
+    return _run_all(calls, "generic_upgrade", max_workers)
@@ -1,23 +1,107 @@
 import re
 import logging
+from functools import lru_cache
 
 logger = logging.getLogger("parsers")
 
+_WHITESPACE_RE = re.compile(r"\s*")
+
+
+@lru_cache(maxsize=1024)
+def _compile(pattern):
+    """
+    Returns compiled pattern, compiled once per unique pattern
+    """
+    return re.compile(pattern)
+
+
+def _row_splitter(delimiter):
+    """
+    Returns function splitting row to stripped fields at delimiter surrounded by optional whitespace
+    """
+    if delimiter == " ":
+        # Plain str.split is much faster than regex for whitespace separated columns
+        return lambda row: row.split() or [""]
+    split_pattern = _compile("\\s*" + delimiter + "\\s*")
+    return lambda row: [x.strip() for x in split_pattern.split(row.strip())]
+
+
+def _as_lines(data):
+    """
+    Returns data as list of rows, data can be text or already split rows
+    """
+    if isinstance(data, str):
+        return data.splitlines()
+    return data
+
+
+def _iter_lines(data):
+    """
+    Yields rows of text one by one without splitting whole text first.
+    Used by parsers returning on first match.
+    """
+    if not isinstance(data, str):
+        yield from data
+        return
+    start = 0
+    while True:
+        end = data.find("\n", start)
+        if end == -1:
+            if start < len(data):
+                yield data[start:].rstrip("\r")
+            return
+        yield data[start:end].rstrip("\r")
+        start = end + 1
+
 
 def get_vertical_data_row(data, key, delimiter=":"):
-    for row in data.splitlines():
+    """
+    Returns value of first "key: value" row, whole data is searched with single regex
+    """
+    if delimiter in key:
+        # Rows are split at first delimiter, such key can never match
+        return None
+    if not isinstance(data, str):
+        data = "\n".join(data)
+    pattern = _compile(
+        "(?m)^[^\\S\\n]*" + re.escape(key) + "[^\\S\\n]*" + re.escape(delimiter) + "(.*)$"
+    )
+    match = pattern.search(data)
+    if match:
+        return match.group(1).strip()
+    return None
+
+
+def get_vertical_data_rows(data, delimiter=":"):
+    """
+    Returns all key-value rows as dict, first occurrence of each key wins
+    """
+    out = {}
+    for row in _as_lines(data):
         if delimiter not in row:
             continue
         name, value = row.split(delimiter, 1)
         name = name.strip()
-        value = value.strip()
-        if key == name:
-            return value.strip()
+        if name not in out:
+            out[name] = value.strip()
+    return out
 
 
 def get_regex_data_row(data, pattern):
-    for row in data.splitlines():
-        match = re.match(pattern, row)
+    """
+    Returns first group of first row matching pattern.
+    Pattern can be precompiled with re.M, then whole data is searched at once.
+    """
+    if isinstance(pattern, re.Pattern):
+        if not isinstance(data, str):
+            data = "\n".join(data)
+        match = pattern.search(data)
+        if match:
+            return match.groups()[0].rstrip("\r")
+        return None
+    compiled = _compile(pattern)
+    for row in _iter_lines(data):
+        match = compiled.match(row)
         if match:
             return match.groups()[0]
 
@@ -25,9 +109,9 @@ def get_regex_data_row(data, pattern):
 def get_tabular_data(data, header, delimiter=" ", skip_after_header=1):
     header_found = False
     out = []
-    split_pattern = "\\s*" + delimiter + "\\s*"
-    for row in data.splitlines():
-        parts = [x.strip() for x in re.split(split_pattern, row.strip())]
+    split_row = _row_splitter(delimiter)
+    for row in _as_lines(data):
+        parts = split_row(row)
         if not header_found:
             if parts == header:
                 header_found = True
@@ -41,21 +125,26 @@ def get_tabular_data(data, header, delimiter=" ", skip_after_header=1):
     return out
 
 
+def find_header(data, headers, delimiter=" "):
+    """
+    Returns first of headers found as a row in data, None if none of them is found
+    """
+    split_row = _row_splitter(delimiter)
+    for row in _iter_lines(data):
+        parts = split_row(row)
+        if parts in headers:
+            return parts
+    return None
+
+
 def get_fixed_field_length(string, field):
     """
     Get length of field + following whitespaces
     """
-    field_length = len(field)
-    if len(string) < field_length:
+    if len(string) < len(field):
         raise ValueError("String shorter than field")
-    if len(string) == len(field):
-        return field_length
-    for x in string[len(field):]:
-        if x.isspace():
-            field_length += 1
-        else:
-            break
-    return field_length
+    # Whitespace run after field is matched in one go without copying rest of the string
+    return _WHITESPACE_RE.match(string, len(field)).end()
 
 
 def get_tabular_data_fixed_header_width(data, header, skip_after_header=1):
@@ -65,13 +154,14 @@ def get_tabular_data_fixed_header_width(data, header, skip_after_header=1):
     """
     header_found = False
     field_lengths = []
+    bounds = []
     out = []
-    for row in data.splitlines():
+    for row in _as_lines(data):
         if not header_found:
             field_lengths = []
             remaining_row = str(row)
             for field in header:
-                logger.info("field: %s, remaining_row: '%s'", field, remaining_row)
+                logger.debug("field: %s, remaining_row: '%s'", field, remaining_row)
                 if remaining_row.startswith(field):
                     # get length
                     length = get_fixed_field_length(remaining_row, field)
@@ -84,30 +174,57 @@ def get_tabular_data_fixed_header_width(data, header, skip_after_header=1):
                 if len(remaining_row) != 0:
                     logger.info("Garbage after last header field: %s", (remaining_row,))
                 header_found = True
+                # Column slice bounds, computed once for all rows
+                bounds = []
+                start = 0
+                for length in field_lengths:
+                    bounds.append((start, start + length))
+                    start += length
             continue
         elif skip_after_header > 0:
             skip_after_header -= 1
             continue
-        parts = []
-        remaining_row = str(row)
-        for field_length in field_lengths:
-            parts.append(remaining_row[:field_length])
-            remaining_row = remaining_row[field_length:]
-        print(parts)
+        parts = [row[start:end] for start, end in bounds]
         out.append(dict(zip(header, parts)))
     return out
 
 
 def match_text(data, text):
-    for row in data.splitlines():
+    """
+    Returns first row containing text, None if text is not found
+    """
+    if isinstance(data, str):
+        # Find text from whole data and expand match to row boundaries
+        position = data.find(text)
+        if position == -1:
+            return None
+        start = data.rfind("\n", 0, position) + 1
+        end = data.find("\n", position)
+        if end == -1:
+            end = len(data)
+        return data[start:end].rstrip("\r")
+    for row in data:
         if text in row:
             return row
     return None
 
 
 def match_pattern(data, pattern):
-    for row in data.splitlines():
-        match = re.match(pattern, row)
+    """
+    Returns groups of first row matching pattern.
+    Pattern can be string or precompiled pattern, keep frequently used patterns precompiled at module level.
+    Pattern precompiled with re.M is searched from whole data at once like in get_regex_data_row.
+    """
+    if isinstance(pattern, re.Pattern) and pattern.flags & re.M:
+        if not isinstance(data, str):
+            data = "\n".join(data)
+        match = pattern.search(data)
+        if match:
+            return tuple(x.rstrip("\r") if x else x for x in match.groups())
+        return None
+    compiled = pattern if isinstance(pattern, re.Pattern) else _compile(pattern)
+    for row in _iter_lines(data):
+        match = compiled.match(row)
         if match:
             return match.groups()
     return None
@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger("pool")
+
+CONNECTION_POOL_IDLE_TIMEOUT = 300
+CONNECTION_POOL_MAX_AGE = 3600
+
+
+class ConnectionPool(object):
+    """
+    Keeps idle device connections around so they can be reused.
+    Connections idle longer than idle_timeout or older than max_age are closed.
+    """
+
+    def __init__(self, idle_timeout=CONNECTION_POOL_IDLE_TIMEOUT, max_age=CONNECTION_POOL_MAX_AGE):
+        self.idle_timeout = idle_timeout
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # key -> (connection, created, released)
+        self._idle = {}
+        # id(connection) -> created
+        self._created = {}
+        self._reaper = None
+
+    def _expired(self, created, released, now):
+        return now - released > self.idle_timeout or now - created > self.max_age
+
+    def get(self, key, factory=None):
+        """
+        Returns idle connection for key, or new connection from factory
+        """
+        with self._lock:
+            entry = self._idle.pop(key, None)
+        if entry:
+            connection, created, released = entry
+            if not self._expired(created, released, time.monotonic()):
+                logger.debug(f"Reusing connection {key}")
+                with self._lock:
+                    self._created[id(connection)] = created
+                return connection
+            self._close(key, connection)
+        if not factory:
+            return None
+        connection = factory()
+        with self._lock:
+            self._created[id(connection)] = time.monotonic()
+        return connection
+
+    def release(self, key, connection):
+        """
+        Return connection to pool
+        """
+        now = time.monotonic()
+        with self._lock:
+            created = self._created.pop(id(connection), now)
+            previous = self._idle.pop(key, None)
+            self._idle[key] = (connection, created, now)
+            if not self._reaper:
+                self._schedule()
+        if previous and previous[0] is not connection:
+            self._close(key, previous[0])
+
+    def discard(self, key, connection):
+        """
+        Close connection instead of returning it to pool
+        """
+        with self._lock:
+            self._created.pop(id(connection), None)
+        self._close(key, connection)
+
+    def reap(self):
+        """
+        Close expired idle connections
+        """
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            self._reaper = None
+            for key, (connection, created, released) in list(self._idle.items()):
+                if self._expired(created, released, now):
+                    expired.append((key, connection))
+                    del self._idle[key]
+            if self._idle:
+                self._schedule()
+        for key, connection in expired:
+            self._close(key, connection)
+
+    def close_all(self):
+        with self._lock:
+            idle = self._idle
+            self._idle = {}
+            if self._reaper:
+                self._reaper.cancel()
+                self._reaper = None
+        for key, (connection, created, released) in idle.items():
+            self._close(key, connection)
+
+    def _schedule(self):
+        self._reaper = threading.Timer(min(self.idle_timeout, self.max_age), self.reap)
+        self._reaper.daemon = True
+        self._reaper.start()
+
+    @staticmethod
+    def _close(key, connection):
+        logger.debug(f"Closing pooled connection {key}")
+        try:
+            connection.close()
+        except Exception as exc:
+            logger.debug(f"Failed to close pooled connection {key}: {exc}")
+
+
+CONNECTION_POOL = ConnectionPool()
@@ -0,0 +1,73 @@
+import logging
+
+try:
+    import easysnmp
+except ImportError:
+    easysnmp = None
+
+logger = logging.getLogger("snmp")
+
+SYS_DESCR = "1.3.6.1.2.1.1.1.0"
+ENT_PHYSICAL_SOFTWARE_REV = "1.3.6.1.2.1.47.1.1.1.1.10"
+ENT_PHYSICAL_FIRMWARE_REV = "1.3.6.1.2.1.47.1.1.1.1.9"
+
+NO_VALUE = ["NOSUCHOBJECT", "NOSUCHINSTANCE", "ENDOFMIBVIEW"]
+
+
+class SNMPError(Exception):
+    pass
+
+
+class SNMPClient(object):
+    """
+    Minimal read-only SNMP client for fetching device information.
+    """
+
+    def __init__(self, address, community="public", version=2, port=161, timeout=2, retries=1):
+        if easysnmp is None:
+            raise RuntimeError("SNMP support requires easysnmp package")
+        self.address = address
+        self._session = easysnmp.Session(
+            hostname=address,
+            community=community,
+            version=version,
+            remote_port=port,
+            timeout=timeout,
+            retries=retries,
+            use_sprint_value=False,
+        )
+
+    def get(self, oid):
+        try:
+            value = self._session.get(oid).value
+        except easysnmp.EasySNMPError as exc:
+            raise SNMPError(f"SNMP get {oid} from {self.address} failed: {exc}")
+        if value in NO_VALUE:
+            return None
+        return value
+
+    def bulkwalk(self, oid, max_repetitions=50):
+        """
+        Returns values under oid, fetched with GETBULK requests
+        """
+        try:
+            variables = self._session.bulkwalk(oid, non_repeaters=0, max_repetitions=max_repetitions)
+        except easysnmp.EasySNMPError as exc:
+            raise SNMPError(f"SNMP bulkwalk {oid} from {self.address} failed: {exc}")
+        return [x.value for x in variables if x.value not in NO_VALUE]
+
+
+def snmp_from_opts(opts):
+    """
+    Returns SNMPClient if SNMP is configured for host, None otherwise
+    """
+    if "snmp_community" not in opts:
+        return None
+    kwargs = {
+        'address': opts["hostname"],
+        'community': opts["snmp_community"],
+    }
+    for key, value in {"snmp_version": "version", "snmp_port": "port"}.items():
+        if key in opts:
+            kwargs[value] = opts[key]
+    return SNMPClient(**kwargs)
@@ -1,3 +1,5 @@
+import functools
+
 
 def compare_version_old(a, b):
     """
@@ -58,25 +60,28 @@ def compare_version_old(a, b):
     return 0
 
 
+@functools.lru_cache(maxsize=256)
+def _parse_version(version):
+    """
+    Returns numeric parts of version as tuple, suffix after "-" is ignored
+    """
+    return tuple(int(x) for x in version.strip().split("-")[0].split("."))
+
+
+@functools.lru_cache(maxsize=1024)
 def compare_version(a, b):
     """
     Returns 1 if a is bigger than b, 0 if same and -1 if b is bigger than a
     """
-    a = a.strip().split("-")[0]
-    b = b.strip().split("-")[0]
-    a_parts = [int(x) for x in a.split(".")]
-    b_parts = [int(x) for x in b.split(".")]
+    if a == b:
+        return 0
+    a_parts = _parse_version(a)
+    b_parts = _parse_version(b)
+    # Pad shorter version with zeros, 7.13 is same as 7.13.0
     max_parts = max(len(a_parts), len(b_parts))
-    if len(a_parts) < max_parts:
-        a_parts += [0] * (max_parts - len(a_parts))
-    if len(b_parts) < max_parts:
-        b_parts += [0] * (max_parts - len(b_parts))
-    for idx in range(max_parts):
-        if a_parts[idx] > b_parts[idx]:
-            return 1
-        if a_parts[idx] < b_parts[idx]:
-            return -1
-    return 0
+    a_parts += (0,) * (max_parts - len(a_parts))
+    b_parts += (0,) * (max_parts - len(b_parts))
+    return (a_parts > b_parts) - (a_parts < b_parts)
 
 
 def min_version(version, to_check):
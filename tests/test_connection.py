@@ -0,0 +1,60 @@
+import unittest
+
+from netcommandlib.connection import cli_run_interactive_block, split_block_output, can_run_as_block
+
+
+class FakeChannel(object):
+    """
+    Returns given chunks one by one from receive, records sent data
+    """
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(data)
+
+    def receive(self, nbytes):
+        if not self.chunks:
+            return b""
+        return self.chunks.pop(0)
+
+
+class BlockOutputTest(unittest.TestCase):
+    COMMANDS = ["show run | i snmp", "show clock"]
+
+    def test_prompt_character_in_output(self):
+        # Prompt characters in output, one of them at end of chunk, are not prompt rows
+        channel = FakeChannel([
+            b"show run | i snmp\r\n",
+            b"snmp-server community pub#1 ro\r\nsnmp-server community priv#",
+            b"2 rw\r\nsw1#show clock\r\n",
+            b"10:00\r\nsw1#",
+        ])
+        data, at_prompt = cli_run_interactive_block(
+            channel.send,
+            channel.receive,
+            [command.encode() + b"\r\n" for command in self.COMMANDS],
+            b"#",
+            timeout=0,
+        )
+        self.assertTrue(at_prompt)
+        self.assertEqual(channel.chunks, [])
+        outputs = split_block_output(data, "#", self.COMMANDS)
+        self.assertEqual(len(outputs), 2)
+        self.assertTrue(outputs[0].endswith("community pub#1 ro\nsnmp-server community priv#2 rw"))
+        self.assertEqual(outputs[1], "10:00")
+
+    def test_split_block_output(self):
+        data = "show run | i snmp\nsnmp-server community pub#1 ro\nsw1#show clock\n10:00\nsw1#"
+        outputs = split_block_output(data, "#", self.COMMANDS)
+        self.assertEqual(outputs, ["show run | i snmp\nsnmp-server community pub#1 ro", "10:00\nsw1#"])
+
+    def test_can_run_as_block(self):
+        self.assertTrue(can_run_as_block(["show version", "sh clock"]))
+        self.assertFalse(can_run_as_block(["show version", "copy running-config startup-config"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
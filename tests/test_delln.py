@@ -0,0 +1,44 @@
+import unittest
+
+from models.delln import find_errors, raise_on_errors
+from netcommandlib.connection import CommandError
+
+
+ERROR_OUTPUT = (
+    "console#show foo\r\n"
+    "                                        ^\r\n"
+    "% Invalid input detected at '^' marker.\r\n"
+    "\r\n"
+)
+
+
+class ErrorDetectionTest(unittest.TestCase):
+
+    def test_find_errors_str(self):
+        self.assertEqual(find_errors(ERROR_OUTPUT), "% Invalid input detected at '^' marker.")
+        self.assertIsNone(find_errors("console#show clock\r\n10:00:00 UTC\r\n"))
+
+    def test_raise_on_errors_str(self):
+        with self.assertRaises(CommandError):
+            raise_on_errors(ERROR_OUTPUT)
+        raise_on_errors("")
+        raise_on_errors(None)
+
+    def test_raise_on_errors_list(self):
+        with self.assertRaises(CommandError):
+            raise_on_errors(ERROR_OUTPUT.splitlines())
+        raise_on_errors(["console#show clock", "10:00:00 UTC"])
+
+    def test_large_output_without_error(self):
+        row = "Gi1/0/1    1     Full   1000   Auto     Up      Enable  Enable  Long description text\r\n"
+        data = row * (100 * 1024 // len(row))
+        self.assertGreater(len(data), 90 * 1024)
+        self.assertIsNone(find_errors(data))
+        raise_on_errors(data)
+        raise_on_errors(data.splitlines())
+        # Error at the very end of large output is still found
+        self.assertIsNotNone(find_errors(data + ERROR_OUTPUT))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import time
+import unittest
+
+from models.dellos10 import OS10
+
+
+SHOW_VERSION_10_5_1 = (
+    "Dell EMC Networking OS10 Enterprise\r\n"
+    "Copyright (c) 1999-2020 by Dell Inc. All Rights Reserved.\r\n"
+    "OS Version: 10.5.1.3\r\n"
+    "Build Version: 10.5.1.3.190\r\n"
+    "Build Time: 2020-06-19T21:48:07+0000\r\n"
+    "System Type: S4148F-ON\r\n"
+    "Architecture: x86_64\r\n"
+    "Up Time: 1 week 3 days 00:11:05\r\n"
+)
+
+SHOW_VERSION_10_5_4 = (
+    "\r\n"
+    "\r\n"
+    "Dell SmartFabric OS10 Enterprise\r\n"
+    "Copyright (c) 1999-2022 by Dell Inc. All Rights Reserved.\r\n"
+    "OS Version: 10.5.4.2\r\n"
+    "Build Version: 10.5.4.2.94\r\n"
+    "Build Time: 2022-09-13T19:42:41+0000\r\n"
+    "System Type: S5248F-ON\r\n"
+    "Architecture: x86_64\r\n"
+    "Up Time: 00:05:21\r\n"
+)
+
+
+def os10_with_output(stdout):
+    """
+    Returns OS10 model answering show version from cache without connection
+    """
+    model = OS10.__new__(OS10)
+    model.hostname = "os10"
+    model.snmp = None
+    model._show_version_cache = (time.monotonic(), stdout)
+    return model
+
+
+class ShowVersionTest(unittest.TestCase):
+
+    def test_platform(self):
+        self.assertEqual(os10_with_output(SHOW_VERSION_10_5_1).get_platform(), "Enterprise")
+
+    def test_platform_leading_blank_lines(self):
+        self.assertEqual(os10_with_output(SHOW_VERSION_10_5_4).get_platform(), "Enterprise")
+
+    def test_platform_empty_output(self):
+        self.assertIsNone(os10_with_output("").get_platform())
+        self.assertIsNone(os10_with_output("\r\n\r\n").get_platform())
+
+    def test_software_version(self):
+        self.assertEqual(os10_with_output(SHOW_VERSION_10_5_1).get_software_version(), "10.5.1.3.190")
+        self.assertEqual(os10_with_output(SHOW_VERSION_10_5_4).get_software_version(), "10.5.4.2.94")
+
+
+if __name__ == "__main__":
+    unittest.main()